@@ -2,17 +2,22 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
-from sklearn.model_selection import train_test_split
-import statsmodels.api as sm
 import requests
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
 import warnings
+import uuid
+import zipfile
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 warnings.filterwarnings('ignore')
 
 st.set_page_config(
@@ -200,80 +205,1005 @@ WB_INDICATORS = {
     "金融深化度（民間融資の対GDP比）": "FD.AST.PRVT.GD.ZS"
 }
 
-@st.cache_data
+PERF_SAMPLE_SIZE = 1000
+PERF_DEBUG = os.environ.get('FINDEX_DEBUG', '') == '1'
+PERF_QUANTILES = {'p50': '0.5', 'p95': '0.95', 'p99': '0.99'}
+
+class PerfRecorder:
+    """処理段階ごとの所要時間（直近sample_size件）とキャッシュのヒット・ミス数を記録する"""
+
+    def __init__(self, sample_size=PERF_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._samples = {}
+        self._totals = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.sample_size)).append(seconds)
+            count, total = self._totals.get(name, (0, 0.0))
+            self._totals[name] = (count + 1, total + seconds)
+
+    def count(self, cache, event, n=1):
+        with self._lock:
+            self._counters[(cache, event)] = self._counters.get((cache, event), 0) + n
+
+    def snapshot(self):
+        """{'stages': {段階: count・total・last・p50・p95・p99（秒）}, 'caches': {キャッシュ: {イベント: 回数}}}"""
+        with self._lock:
+            samples = {name: np.array(values) for name, values in self._samples.items()}
+            totals = dict(self._totals)
+            counters = dict(self._counters)
+        stages = {}
+        for name, values in samples.items():
+            count, total = totals[name]
+            stages[name] = {'count': count, 'total': total, 'last': float(values[-1])}
+            stages[name].update(zip(PERF_QUANTILES, np.percentile(values, [50, 95, 99]).tolist()))
+        caches = {}
+        for (cache, event), n in counters.items():
+            caches.setdefault(cache, {})[event] = n
+        return {'stages': stages, 'caches': caches}
+
+def perf_to_prometheus(snapshot):
+    """snapshot()の結果をPrometheusのテキスト形式に変換する"""
+    lines = ['# TYPE findex_stage_seconds summary']
+    for name, stats in sorted(snapshot['stages'].items()):
+        for key, quantile in PERF_QUANTILES.items():
+            lines.append(f'findex_stage_seconds{{stage="{name}",quantile="{quantile}"}} {stats[key]:.6f}')
+        lines.append(f'findex_stage_seconds_sum{{stage="{name}"}} {stats["total"]:.6f}')
+        lines.append(f'findex_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+    lines.append('# TYPE findex_cache_events_total counter')
+    for cache, events in sorted(snapshot['caches'].items()):
+        for event, n in sorted(events.items()):
+            lines.append(f'findex_cache_events_total{{cache="{cache}",event="{event}"}} {n}')
+    return '\n'.join(lines) + '\n'
+
+@st.cache_resource(show_spinner=False)
+def get_perf_recorder():
+    return PerfRecorder()
+
+def perf_stage(name):
+    return get_perf_recorder().stage(name)
+
+def perf_count(cache, event):
+    get_perf_recorder().count(cache, event)
+
+def plotly_chart(fig, **kwargs):
+    """図のシリアライズを含むst.plotly_chartの所要時間を記録して描画する"""
+    with perf_stage('plotly'):
+        st.plotly_chart(fig, **kwargs)
+
+FINDEX_WORKBOOK = 'Findex2025_1760415783997.xlsx'
+FINDEX_CACHE_DIR = '.findex_cache'
+FINDEX_CACHE_FILE = 'findex_data.npz'
+FINDEX_MANIFEST_FILE = 'manifest.json'
+
+def _file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _frame_to_arrays(frame):
+    """DataFrameを列ごとのNumPy配列（文字列列は欠損マスク付き）に変換"""
+    arrays = {'__columns__': np.array([str(c) for c in frame.columns])}
+    for i, (_, col) in enumerate(frame.items()):
+        if pd.api.types.is_numeric_dtype(col):
+            arrays[f'c{i}'] = col.to_numpy()
+        else:
+            mask = col.isna().to_numpy()
+            arrays[f'c{i}'] = np.array(['' if m else str(v) for v, m in zip(col.tolist(), mask)])
+            arrays[f'm{i}'] = mask
+    return arrays
+
+def _arrays_to_frame(arrays):
+    columns = arrays['__columns__'].tolist()
+    data = {}
+    for i, name in enumerate(columns):
+        values = arrays[f'c{i}']
+        if f'm{i}' in arrays:
+            values = pd.Series(values).mask(arrays[f'm{i}'])
+        data[name] = values
+    return pd.DataFrame(data, columns=columns)
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, FINDEX_MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _tmp_path(path):
+    """同じディレクトリに書き込む一時ファイル名（プロセス・呼び出しごとに一意にし、並行する書き込みと衝突させない）"""
+    return f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+def _write_manifest(cache_dir, manifest):
+    tmp_manifest = _tmp_path(os.path.join(cache_dir, FINDEX_MANIFEST_FILE))
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_manifest, os.path.join(cache_dir, FINDEX_MANIFEST_FILE))
+
+def build_findex_cache(workbook=FINDEX_WORKBOOK, cache_dir=FINDEX_CACHE_DIR, sha256=None):
+    """ExcelのDataシートを一度だけ読み込み、列指向の.npzキャッシュに変換"""
+    raw = pd.read_excel(workbook, sheet_name='Data')
+    stat = os.stat(workbook)
+    manifest = {
+        'workbook': os.path.basename(workbook),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': sha256 or _file_sha256(workbook),
+        'rows': len(raw),
+    }
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = _tmp_path(os.path.join(cache_dir, FINDEX_CACHE_FILE))
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **_frame_to_arrays(raw))
+        os.replace(tmp_path, os.path.join(cache_dir, FINDEX_CACHE_FILE))
+        _write_manifest(cache_dir, manifest)
+    except OSError as e:
+        warnings.warn(f"Findexキャッシュを書き込めませんでした: {e}")
+    return raw, manifest
+
+def fresh_findex_manifest(workbook=FINDEX_WORKBOOK, cache_dir=FINDEX_CACHE_DIR):
+    """キャッシュがブックと一致していればそのマニフェストを、古いか無ければNoneを返す（ブックがなければキャッシュを信じる）"""
+    manifest = _read_manifest(cache_dir)
+    if not (os.path.exists(os.path.join(cache_dir, FINDEX_CACHE_FILE)) and manifest.get('sha256')):
+        return None
+    if not os.path.exists(workbook):
+        return manifest
+
+    stat = os.stat(workbook)
+    if manifest.get('mtime_ns') == stat.st_mtime_ns and manifest.get('size') == stat.st_size:
+        return manifest
+    if _file_sha256(workbook) != manifest['sha256']:
+        return None
+    manifest.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    try:
+        _write_manifest(cache_dir, manifest)
+    except OSError:
+        pass
+    return manifest
+
+def load_findex_frame(workbook=FINDEX_WORKBOOK, cache_dir=FINDEX_CACHE_DIR):
+    """キャッシュが最新ならそこから読み込み、ブックが更新されていれば再構築する"""
+    manifest = fresh_findex_manifest(workbook, cache_dir)
+    if manifest is not None:
+        try:
+            with np.load(os.path.join(cache_dir, FINDEX_CACHE_FILE)) as arrays:
+                frame = _arrays_to_frame(arrays)
+            perf_count('findex_file', 'hit')
+            return frame, manifest
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # 書き込み途中などで壊れた.npzはブックから作り直す
+            pass
+
+    if not os.path.exists(workbook):
+        raise FileNotFoundError(workbook)
+    perf_count('findex_file', 'miss')
+    return build_findex_cache(workbook, cache_dir)
+
+FINDEX_FLOAT32 = os.environ.get('FINDEX_FLOAT32', '') == '1'
+FINDEX_CATEGORY_COLUMNS = ['Economy', 'Economy_JP', 'Demographic group', 'Demographic sub-group']
+
+def compact_findex_frame(df, float32=False):
+    """分析に使う列だけを残し、文字列列をカテゴリ型に（float32=Trueなら指標列をfloat32に）変換"""
+    indicators = [col for col in df.columns if '(%, age 15+)' in col]
+    df = df[FINDEX_CATEGORY_COLUMNS + ['Year'] + indicators].copy()
+    for col in FINDEX_CATEGORY_COLUMNS:
+        df[col] = df[col].astype('category')
+    if float32 and indicators:
+        df[indicators] = df[indicators].astype('float32')
+    return df
+
+def findex_memory_report(df):
+    """読み込み時に記録した圧縮前後のメモリ使用量（MB）"""
+    report = df.attrs.get('memory_report', {})
+    labels = {'before': '圧縮前（全列・文字列）', 'after': '圧縮後（DataFrame）',
+              'cube': 'キューブ（メモリマップ、全ワーカーで共有）'}
+    return pd.DataFrame({'項目': [labels[k] for k in labels if k in report],
+                         'MB': [report[k] / 1024 ** 2 for k in labels if k in report]})
+
+def _country_map_digest():
+    """COUNTRY_MAPの内容のハッシュ（対応表が変われば対象の行も変わるため、データセットのバージョンに含める）"""
+    payload = json.dumps(sorted(COUNTRY_MAP.items()), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def findex_dataset_version(manifest):
+    return manifest['sha256'][:16] + '-' + _country_map_digest()[:8] + ('-f32' if FINDEX_FLOAT32 else '')
+
+def load_compact_findex_frame():
+    """.npzキャッシュ（またはブック）から全行を読み込み、分析用に圧縮したDataFrameを返す"""
+    df, manifest = load_findex_frame()
+    df['Economy_JP'] = df['Economy'].map(COUNTRY_MAP)
+    df = df.dropna(subset=['Economy_JP'])
+    before = int(df.memory_usage(deep=True).sum())
+    df = compact_findex_frame(df, float32=FINDEX_FLOAT32)
+    df.attrs['dataset_version'] = findex_dataset_version(manifest)
+    df.attrs['memory_report'] = {'before': before, 'after': int(df.memory_usage(deep=True).sum())}
+    return df
+
+def cube_backed_frame(cube, dataset_version):
+    """共有キューブがあるときに使う、行を持たないDataFrame（列・型・バージョンだけを持つ）
+    
+    値はすべてキューブから読むので、ワーカーごとに全行を読み込まない。'findex_rows'に元の行数を記録する。
+    """
+    columns = {col: pd.Series(dtype='category') for col in FINDEX_CATEGORY_COLUMNS}
+    columns['Year'] = pd.Series(dtype=np.asarray(cube.years).dtype)
+    for indicator in cube.indicators:
+        columns[indicator] = pd.Series(dtype=cube.values.dtype)
+    df = pd.DataFrame(columns)
+    df.attrs['dataset_version'] = dataset_version
+    df.attrs['findex_rows'] = cube.n_rows
+    df.attrs['memory_report'] = {'after': int(df.memory_usage(deep=True).sum()), 'cube': int(cube.values.nbytes)}
+    return df
+
+def findex_row_count(df):
+    """元データの行数（キューブから作った行のないDataFrameでは記録した行数）"""
+    return df.attrs.get('findex_rows', len(df))
+
+@st.cache_resource(show_spinner=False)
+def _cached_findex_data():
+    manifest = fresh_findex_manifest()
+    if manifest is not None:
+        version = findex_dataset_version(manifest)
+        cube = open_findex_cube(version)
+        if cube is not None:
+            perf_count('findex_file', 'cube')
+            return cube_backed_frame(cube, version)
+    return load_compact_findex_frame()
+
 def load_findex_data():
+    """Findexデータを読み込む（プロセス内で1つのDataFrameを全セッションが共有するため、変更しないこと）
+    
+    同じバージョンの共有キューブがあれば.npzは読まず、行のないDataFrame（cube_backed_frame）を返す。
+    キューブがまだなければ全行を読み込み、そこからキューブを作って共有ファイルに書き出す。
+    読み込みに失敗したときの空のDataFrameはキャッシュせず、次の再実行で読み込み直す。
+    """
     try:
-        df = pd.read_excel('Findex2025_1760415783997.xlsx', sheet_name='Data')
-        df['Economy_JP'] = df['Economy'].map(COUNTRY_MAP)
-        df = df.dropna(subset=['Economy_JP'])
-        return df
+        return _cached_findex_data()
     except Exception as e:
         st.error(f"データ読み込みエラー: {e}")
         return pd.DataFrame()
 
-@st.cache_data
+class FindexMetadata:
+    """読み込み時に一度だけ作る軸情報（指標・年・属性区分・国）とデータセットのバージョン
+    
+    キューブがあればその軸ラベルから作り、DataFrameは走査しない。
+    """
+
+    def __init__(self, df, cube=None):
+        self.version = df.attrs.get('dataset_version')
+        self.sub_groups = {}
+        if cube is not None:
+            self.indicators = sorted(cube.indicators)
+            self.years = sorted(int(y) for y in cube.years if pd.notna(y))
+            pairs = [(g, sg) for g, sg in cube.slices if pd.notna(g) and pd.notna(sg)]
+            self.countries = [c for c in dict.fromkeys(cube.economies_jp) if pd.notna(c)]
+        else:
+            self.indicators = sorted(col for col in df.columns if '(%, age 15+)' in col)
+            self.years = sorted(int(y) for y in pd.unique(df['Year']) if pd.notna(y))
+            pairs = df[['Demographic group', 'Demographic sub-group']].drop_duplicates().dropna()
+            pairs = pairs.itertuples(index=False)
+            self.countries = [c for c in pd.unique(df['Economy_JP']) if pd.notna(c)]
+        for group, sub_group in pairs:
+            self.sub_groups.setdefault(group, []).append(sub_group)
+
+@st.cache_resource(show_spinner=False)
+def _cached_findex_metadata(dataset_version, _df):
+    return FindexMetadata(_df, get_findex_cube(_df))
+
+def get_findex_metadata(df):
+    version = df.attrs.get('dataset_version')
+    if version is None:
+        return FindexMetadata(df)
+    return _cached_findex_metadata(version, df)
+
 def get_all_indicators(df):
     """データフレームからすべての指標列を取得"""
-    indicator_cols = [col for col in df.columns if '(%, age 15+)' in col]
-    return sorted(indicator_cols)
+    return get_findex_metadata(df).indicators
+
+def _economy_names():
+    """地域・所得層の集計値を除いた全経済圏の日本語名（COUNTRY_MAPの順）"""
+    return [c for c in dict.fromkeys(COUNTRY_MAP.values()) if c not in REGIONS]
+
+WB_API_URL = os.environ.get('FINDEX_WB_API_URL', 'https://api.worldbank.org/v2')
+WB_BACKEND = os.environ.get('FINDEX_WB_BACKEND', 'auto')
+WB_CACHE_DIR = os.path.join(FINDEX_CACHE_DIR, 'worldbank')
+WB_FIXTURE_DIR = 'wb_fixtures'
+WB_CACHE_TTL = 7 * 24 * 3600
+WB_CACHE_MAX_STALE = 180 * 24 * 3600
 
-@st.cache_data
-def get_world_bank_data(indicator_code, year=2024, country_list=None):
+def _wb_country_codes(country_list=None):
+    if country_list:
+        codes = [COUNTRY_CODE_MAP.get(c) for c in country_list if c in COUNTRY_CODE_MAP]
+    else:
+        codes = list(COUNTRY_CODE_MAP.values())
+    return sorted(set(codes))
+
+def _wb_cache_path(indicator_code, year, country_codes):
+    key = f"{indicator_code}|{year}|{';'.join(country_codes)}"
+    return os.path.join(WB_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+def _wb_store_read(indicator_code, year, country_codes):
     try:
-        if country_list:
-            country_codes = [COUNTRY_CODE_MAP.get(c) for c in country_list if c in COUNTRY_CODE_MAP]
-        else:
-            country_codes = list(COUNTRY_CODE_MAP.values())
-        
-        if not country_codes:
-            return pd.DataFrame()
-        
-        url = f"https://api.worldbank.org/v2/country/{';'.join(country_codes)}/indicator/{indicator_code}"
-        params = {'date': str(year), 'format': 'json', 'per_page': 1000}
-        response = requests.get(url, params=params, timeout=30)
-        if response.status_code == 200:
-            data = response.json()
-            if len(data) > 1 and data[1]:
-                return pd.DataFrame(data[1])
-        return pd.DataFrame()
+        with open(_wb_cache_path(indicator_code, year, country_codes), encoding='utf-8') as f:
+            entry = json.load(f)
+        return entry['records'], entry['fetched_at']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _wb_store_write(indicator_code, year, country_codes, records):
+    path = _wb_cache_path(indicator_code, year, country_codes)
+    entry = {'indicator': indicator_code, 'year': year, 'countries': country_codes,
+             'fetched_at': time.time(), 'records': records}
+    try:
+        os.makedirs(WB_CACHE_DIR, exist_ok=True)
+        tmp_path = _tmp_path(path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        warnings.warn(f"世界銀行データのキャッシュを書き込めませんでした: {e}")
+
+def _wb_store_lookup(indicator_code, year, country_codes):
+    """完全一致のエントリがなければ、全対象国で取得済みのエントリから該当国を抜き出す"""
+    cached = _wb_store_read(indicator_code, year, country_codes)
+    all_codes = _wb_country_codes()
+    if cached is None and country_codes != all_codes:
+        full = _wb_store_read(indicator_code, year, all_codes)
+        if full is not None:
+            wanted = set(country_codes)
+            records, fetched_at = full
+            cached = ([r for r in records if (r.get('country') or {}).get('id') in wanted], fetched_at)
+    return cached
+
+@st.cache_resource(show_spinner=False)
+def _wb_http_session():
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=['GET'])
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(max_retries=retry, pool_maxsize=16))
+    session.mount('http://', HTTPAdapter(max_retries=retry, pool_maxsize=16))
+    return session
+
+def _fetch_wb_api(indicator_code, year, country_codes):
+    url = f"{WB_API_URL}/country/{';'.join(country_codes)}/indicator/{indicator_code}"
+    params = {'date': str(year), 'format': 'json', 'per_page': 1000, 'page': 1}
+    records = []
+    while True:
+        response = _wb_http_session().get(url, params=params, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        if len(data) > 1 and data[1]:
+            records.extend(data[1])
+        pages = int(data[0].get('pages') or 1) if data and isinstance(data[0], dict) else 1
+        if params['page'] >= pages:
+            return records
+        params['page'] += 1
+
+def _wb_fixture_path(indicator_code, year):
+    return os.path.join(WB_FIXTURE_DIR, f"{indicator_code}_{year}.json")
+
+def _fetch_wb_local(indicator_code, year, country_codes):
+    """wb_fixtures/<指標コード>_<年>.json（APIのJSON応答をそのまま保存したもの）から取得"""
+    with open(_wb_fixture_path(indicator_code, year), encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list) and len(data) == 2 and isinstance(data[1], list):
+        data = data[1]
+    wanted = set(country_codes)
+    return [r for r in data if (r.get('country') or {}).get('id') in wanted]
+
+WB_BACKENDS = {
+    'api': _fetch_wb_api,
+    'local': _fetch_wb_local,
+}
+
+@st.cache_resource(show_spinner=False)
+def _wb_refresh_state():
+    return {'lock': threading.Lock(), 'pending': set()}
+
+def _wb_refresh_in_background(indicator_code, year, country_codes):
+    state = _wb_refresh_state()
+    key = (indicator_code, year, tuple(country_codes))
+    with state['lock']:
+        if key in state['pending']:
+            return
+        state['pending'].add(key)
+
+    def refresh():
+        try:
+            _wb_store_write(indicator_code, year, country_codes,
+                            WB_BACKENDS['api'](indicator_code, year, country_codes))
+        except Exception:
+            pass
+        finally:
+            with state['lock']:
+                state['pending'].discard(key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+def fetch_world_bank_records(indicator_code, year=2024, country_list=None, backend=None):
+    """ディスクキャッシュ（TTL・stale-while-revalidate付き）経由で世界銀行データのレコードを取得"""
+    backend = backend or WB_BACKEND
+    country_codes = _wb_country_codes(country_list)
+    if not country_codes:
+        return []
+
+    cached = _wb_store_lookup(indicator_code, year, country_codes)
+    if backend == 'local':
+        if cached is not None:
+            perf_count('worldbank', 'hit')
+            return cached[0]
+        perf_count('worldbank', 'miss')
+        return WB_BACKENDS['local'](indicator_code, year, country_codes)
+
+    if cached is not None:
+        records, fetched_at = cached
+        age = time.time() - fetched_at
+        if age < WB_CACHE_TTL:
+            perf_count('worldbank', 'hit')
+            return records
+        if age < WB_CACHE_MAX_STALE:
+            perf_count('worldbank', 'stale')
+            _wb_refresh_in_background(indicator_code, year, country_codes)
+            return records
+
+    perf_count('worldbank', 'miss')
+    try:
+        with perf_stage('worldbank_fetch'):
+            records = WB_BACKENDS['api'](indicator_code, year, country_codes)
+    except Exception:
+        perf_count('worldbank', 'error')
+        if cached is not None:
+            return cached[0]
+        # フィクスチャがなければ、その読み込みエラーではなくAPIの本来のエラーを伝える
+        if backend == 'auto' and os.path.exists(_wb_fixture_path(indicator_code, year)):
+            return WB_BACKENDS['local'](indicator_code, year, country_codes)
+        raise
+    _wb_store_write(indicator_code, year, country_codes, records)
+    return records
+
+def prefetch_world_bank_data(indicator_codes=None, years=(2024,), max_workers=8, backend=None):
+    """全指標・全対象国の世界銀行データを並列に取得してディスクキャッシュを温める"""
+    indicator_codes = list(indicator_codes or WB_INDICATORS.values())
+    tasks = [(code, year) for code in indicator_codes for year in years]
+    results = {}
+
+    def fetch(task):
+        code, year = task
+        try:
+            return task, len(fetch_world_bank_records(code, year, None, backend))
+        except Exception as e:
+            return task, e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for task, result in executor.map(fetch, tasks):
+            results[task] = result
+    return results
+
+@st.cache_resource(show_spinner=False)
+def start_world_bank_prefetch():
+    """サーバー起動後の最初の実行時に一度だけ、バックグラウンドで事前取得を開始（完了は'ready'で待てる）"""
+    state = {'done': False, 'results': {}, 'ready': threading.Event()}
+    if WB_BACKEND == 'local':
+        state['done'] = True
+        state['ready'].set()
+        return state
+
+    def run():
+        try:
+            state['results'] = prefetch_world_bank_data()
+        finally:
+            state['done'] = True
+            state['ready'].set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return state
+
+def world_bank_data_version(indicator_code, year=2024, country_list=None):
+    """手元にある世界銀行データの取得時刻（ローカルのフィクスチャはファイルの更新時刻、未取得ならNone）"""
+    cached = _wb_store_lookup(indicator_code, year, _wb_country_codes(country_list))
+    if cached is not None:
+        return cached[1]
+    try:
+        return os.path.getmtime(_wb_fixture_path(indicator_code, year))
+    except OSError:
+        return None
+
+@st.cache_data(ttl=3600)
+def get_world_bank_data(indicator_code, year=2024, country_list=None, data_version=None):
+    """data_versionはキャッシュキーにだけ使う（world_bank_data_versionを渡すと更新後に読み直す）"""
+    try:
+        records = fetch_world_bank_records(indicator_code, year, country_list)
+        return pd.DataFrame(records) if records else pd.DataFrame()
     except Exception as e:
         st.warning(f"世界銀行API接続エラー: {e}")
         return pd.DataFrame()
 
+class FindexCube:
+    """経済圏 × 属性区分 × 年 × 指標 の密な配列（値は%表記、読み取り専用）"""
+
+    KEY_COLUMNS = ['Economy', 'Demographic group', 'Demographic sub-group', 'Year']
+
+    def __init__(self, values, economies, slices, years, indicators, n_rows):
+        self.values = values
+        self.economies = economies
+        self.economies_jp = np.array([COUNTRY_MAP.get(e) for e in economies], dtype=object)
+        self.slices = slices
+        self.years = years
+        self.indicators = indicators
+        self.n_rows = n_rows
+        self.economy_index = {e: i for i, e in enumerate(economies)}
+        self.slice_index = {s: i for i, s in enumerate(slices)}
+        self.year_index = {y: i for i, y in enumerate(years)}
+        self.indicator_index = {ind: i for i, ind in enumerate(indicators)}
+        self.group_slices = {}
+        for i, (group, _) in enumerate(slices):
+            self.group_slices.setdefault(group, []).append(i)
+
+    def slice_id(self, demographic_group='all', sub_group=None):
+        """属性区分の位置を返す（sub_group省略時はグループ内に1区分のみの場合に限る）"""
+        if sub_group is None:
+            candidates = self.group_slices.get(demographic_group, [])
+            return candidates[0] if len(candidates) == 1 else None
+        return self.slice_index.get((demographic_group, sub_group))
+
+    def column(self, indicator, year, slice_id):
+        """全経済圏の値をゼロコピーのビューで返す（該当なしはNone）"""
+        i = self.indicator_index.get(indicator)
+        y = self.year_index.get(year)
+        if i is None or y is None or slice_id is None:
+            return None
+        return self.values[:, slice_id, y, i]
+
+def build_findex_cube(df):
+    indicators = [col for col in df.columns if '(%, age 15+)' in col]
+    grouped = df.groupby(FindexCube.KEY_COLUMNS, sort=False, dropna=False, observed=True)[indicators].first()
+    codes = []
+    uniques = []
+    for level in range(len(FindexCube.KEY_COLUMNS)):
+        level_codes, level_uniques = pd.factorize(grouped.index.get_level_values(level), use_na_sentinel=False)
+        codes.append(level_codes)
+        uniques.append(list(level_uniques))
+    economy_codes, group_codes, sub_group_codes, year_codes = codes
+    n_sub_groups = len(uniques[2])
+    slice_codes, combined = pd.factorize(group_codes * n_sub_groups + sub_group_codes)
+    slices = [(uniques[1][c // n_sub_groups], uniques[2][c % n_sub_groups]) for c in combined]
+    dtype = np.float32 if indicators and all(df[col].dtype == np.float32 for col in indicators) else np.float64
+    values = np.full((len(uniques[0]), len(slices), len(uniques[3]), len(indicators)), np.nan, dtype=dtype)
+    values[economy_codes, slice_codes, year_codes] = grouped.to_numpy(dtype=dtype) * 100
+    values.flags.writeable = False
+    return FindexCube(values, uniques[0], slices, uniques[3], indicators, len(df))
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+def save_findex_cube(cube, dataset_version, cache_dir=FINDEX_CACHE_DIR):
+    """キューブを.npy（値）と.json（軸ラベル）としてアトミックに書き出す"""
+    os.makedirs(cache_dir, exist_ok=True)
+    base = os.path.join(cache_dir, f"findex_cube_{dataset_version}")
+    meta = {
+        'economies': [_plain(e) for e in cube.economies],
+        'slices': [[_plain(g), _plain(sg)] for g, sg in cube.slices],
+        'years': [_plain(y) for y in cube.years],
+        'indicators': list(cube.indicators),
+        'n_rows': cube.n_rows,
+        'dataset_version': dataset_version,
+    }
+    tmp_suffix = f".{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    with open(base + '.npy' + tmp_suffix, 'wb') as f:
+        np.save(f, np.ascontiguousarray(cube.values))
+    with open(base + '.json' + tmp_suffix, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(base + '.npy' + tmp_suffix, base + '.npy')
+    os.replace(base + '.json' + tmp_suffix, base + '.json')
+
+def open_findex_cube(dataset_version, cache_dir=FINDEX_CACHE_DIR):
+    """保存済みキューブを読み取り専用でメモリマップする（全ワーカーでページを共有）
+    
+    記録されたデータセットのバージョンと配列の形が軸ラベルと一致しなければNone（作り直す）。
+    """
+    base = os.path.join(cache_dir, f"findex_cube_{dataset_version}")
+    try:
+        with open(base + '.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        values = np.load(base + '.npy', mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    shape = (len(meta['economies']), len(meta['slices']), len(meta['years']), len(meta['indicators']))
+    if meta.get('dataset_version') != dataset_version or values.shape != shape:
+        return None
+    slices = [(np.nan if g is None else g, np.nan if sg is None else sg) for g, sg in meta['slices']]
+    return FindexCube(values, meta['economies'], slices, meta['years'], meta['indicators'], meta['n_rows'])
+
+@st.cache_resource(show_spinner=False)
+def _cached_findex_cube(dataset_version, _df):
+    cube = open_findex_cube(dataset_version)
+    if cube is not None:
+        perf_count('cube', 'hit')
+        return cube
+    perf_count('cube', 'miss')
+    if len(_df) == 0 and _df.attrs.get('findex_rows'):
+        # 共有キューブが読み込み後に消えた場合は、行を持たないDataFrameの代わりに全行を読み込んで作り直す
+        _df = load_compact_findex_frame()
+    cube = build_findex_cube(_df)
+    try:
+        save_findex_cube(cube, dataset_version)
+    except OSError as e:
+        warnings.warn(f"キューブを共有ファイルに書き出せませんでした: {e}")
+        return cube
+    return open_findex_cube(dataset_version) or cube
+
+def get_findex_cube(df):
+    """読み込み済みデータに対応するキューブを返す（部分集合のDataFrameにはNone）
+    
+    キューブの新しさはバージョン（ブックのハッシュと国名対応表）で確かめる。
+    行数の比較は、attrsを引き継いだ部分集合のDataFrameを見分けるためだけに行う。
+    """
+    version = df.attrs.get('dataset_version')
+    n_rows = findex_row_count(df)
+    if version is None or n_rows == 0:
+        return None
+    cube = _cached_findex_cube(version, df)
+    return cube if cube.n_rows == n_rows else None
+
+def _cube_frame(cube, indicator_eng, year, slice_names):
+    columns = []
+    for slice_id in slice_names:
+        values = cube.column(indicator_eng, year, slice_id)
+        if values is None:
+            return None
+        columns.append(values)
+    valid = pd.notna(cube.economies_jp)
+    for values in columns:
+        valid &= ~np.isnan(values)
+    data = {'国': cube.economies_jp[valid]}
+    for name, values in zip(slice_names.values(), columns):
+        data[name] = values[valid]
+    return pd.DataFrame(data)
+
 def get_data_for_indicator(df, indicator_eng, demographic_group='all', year=2024):
+    with perf_stage('filter'):
+        return _get_data_for_indicator(df, indicator_eng, demographic_group, year)
+
+def _get_data_for_indicator(df, indicator_eng, demographic_group, year):
+    cube = get_findex_cube(df)
+    if cube is not None and indicator_eng in cube.indicator_index:
+        frames = []
+        for s in cube.group_slices.get(demographic_group, []):
+            frame = _cube_frame(cube, indicator_eng, year, {s: '値'})
+            if frame is not None:
+                frames.append(frame)
+        if len(frames) == 1:
+            return frames[0]
+        if frames:
+            return pd.concat(frames, ignore_index=True)
+        return pd.DataFrame({'国': pd.Series(dtype=object), '値': pd.Series(dtype=float)})
+
     filtered = df[(df['Demographic group'] == demographic_group) & (df['Year'] == year)]
     result = filtered[['Economy_JP', indicator_eng]].dropna()
     result.columns = ['国', '値']
     result['値'] = result['値'] * 100
     return result
 
-def get_gender_data(df, indicator_eng, year=2024):
-    data_all = df[(df['Demographic group'] == 'gender') & (df['Demographic sub-group'] == 'men') & (df['Year'] == year)]
-    male_data = data_all[['Economy_JP', indicator_eng]].dropna()
-    male_data.columns = ['国', '男性']
-    male_data['男性'] = male_data['男性'] * 100
+GAP_DEFINITIONS = {
+    '男女別': {'group': 'gender', 'sub_groups': {'men': '男性', 'women': '女性'}},
+    '所得水準別': {'group': 'income', 'sub_groups': {'richest 60%': '富裕層60%', 'poorest 40%': '貧困層40%'}},
+}
+
+GAP_SEVERITY_LABELS = {'gap': '最大格差（絶対値, pt）', 'ratio': '比率の1からの最大乖離'}
+
+def build_gap_tables(cube):
+    """男女別・所得水準別の値、格差（前者−後者）、比率（後者÷前者）を全経済圏 × 年 × 指標で一括計算"""
+    tables = {}
+    for name, definition in GAP_DEFINITIONS.items():
+        slice_ids = [cube.slice_id(definition['group'], sub_group) for sub_group in definition['sub_groups']]
+        if None in slice_ids:
+            continue
+        first = cube.values[:, slice_ids[0]]
+        second = cube.values[:, slice_ids[1]]
+        complete = ~np.isnan(first) & ~np.isnan(second)
+        first = np.where(complete, first, np.nan)
+        second = np.where(complete, second, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(first != 0, second / first, np.nan)
+        tables[name] = {'labels': list(definition['sub_groups'].values()), 'first': first, 'second': second,
+                        'gap': first - second, 'ratio': ratio}
+    return tables
+
+@st.cache_resource(show_spinner=False)
+def _cached_gap_tables(dataset_version, _df):
+    return build_gap_tables(get_findex_cube(_df))
+
+def get_gap_tables(df):
+    """データセットごとに一度だけ計算した格差テーブル（キューブがなければNone）"""
+    if get_findex_cube(df) is None:
+        return None
+    return _cached_gap_tables(df.attrs['dataset_version'], df)
+
+def get_gap_data(df, split, indicator_eng, year=2024):
+    """指定した指標・年の国別の値と格差・比率（両区分が揃う国のみ）"""
+    cube = get_findex_cube(df)
+    tables = get_gap_tables(df)
+    table = tables.get(split) if tables else None
+    i = cube.indicator_index.get(indicator_eng) if cube is not None else None
+    y = cube.year_index.get(year) if cube is not None else None
+    first_label, second_label = list(GAP_DEFINITIONS[split]['sub_groups'].values())
+    if table is None or i is None or y is None:
+        return pd.DataFrame({name: pd.Series(dtype=float) for name in ['国', first_label, second_label, '格差', '比率']})
     
-    data_all = df[(df['Demographic group'] == 'gender') & (df['Demographic sub-group'] == 'women') & (df['Year'] == year)]
-    female_data = data_all[['Economy_JP', indicator_eng]].dropna()
-    female_data.columns = ['国', '女性']
-    female_data['女性'] = female_data['女性'] * 100
+    first = table['first'][:, y, i]
+    valid = ~np.isnan(first) & pd.notna(cube.economies_jp)
+    return pd.DataFrame({
+        '国': cube.economies_jp[valid],
+        first_label: first[valid],
+        second_label: table['second'][:, y, i][valid],
+        '格差': table['gap'][:, y, i][valid],
+        '比率': table['ratio'][:, y, i][valid],
+    })
+
+def _get_sub_group_data(df, indicator_eng, year, demographic_group, sub_groups):
+    cube = get_findex_cube(df)
+    if cube is not None and indicator_eng in cube.indicator_index:
+        for split, definition in GAP_DEFINITIONS.items():
+            if definition['group'] == demographic_group and definition['sub_groups'] == sub_groups:
+                return get_gap_data(df, split, indicator_eng, year)[['国'] + list(sub_groups.values())]
     
-    merged = pd.merge(male_data, female_data, on='国', how='inner')
+    merged = None
+    for sub_group, name in sub_groups.items():
+        data_all = df[(df['Demographic group'] == demographic_group) & (df['Demographic sub-group'] == sub_group) & (df['Year'] == year)]
+        sub_df = data_all[['Economy_JP', indicator_eng]].dropna()
+        sub_df.columns = ['国', name]
+        sub_df[name] = sub_df[name] * 100
+        merged = sub_df if merged is None else pd.merge(merged, sub_df, on='国', how='inner')
     return merged
 
+def get_gender_data(df, indicator_eng, year=2024):
+    return _get_sub_group_data(df, indicator_eng, year, 'gender', GAP_DEFINITIONS['男女別']['sub_groups'])
+
 def get_income_data(df, indicator_eng, year=2024):
-    rich_data = df[(df['Demographic group'] == 'income') & (df['Demographic sub-group'] == 'richest 60%') & (df['Year'] == year)]
-    rich_df = rich_data[['Economy_JP', indicator_eng]].dropna()
-    rich_df.columns = ['国', '富裕層60%']
-    rich_df['富裕層60%'] = rich_df['富裕層60%'] * 100
+    return _get_sub_group_data(df, indicator_eng, year, 'income', GAP_DEFINITIONS['所得水準別']['sub_groups'])
+
+def rank_gaps(df, split, year, by='gap', top_k=5):
+    """全指標の国別格差を一度のソートで並べ替え、指標ごとの上位top_k国と指標別の要約を返す"""
+    cube = get_findex_cube(df)
+    tables = get_gap_tables(df)
+    if cube is None or not tables or split not in tables or year not in cube.year_index:
+        return pd.DataFrame(), pd.DataFrame()
     
-    poor_data = df[(df['Demographic group'] == 'income') & (df['Demographic sub-group'] == 'poorest 40%') & (df['Year'] == year)]
-    poor_df = poor_data[['Economy_JP', indicator_eng]].dropna()
-    poor_df.columns = ['国', '貧困層40%']
-    poor_df['貧困層40%'] = poor_df['貧困層40%'] * 100
+    table = tables[split]
+    y = cube.year_index[year]
+    is_country = np.array([c is not None and c not in REGIONS for c in cube.economies_jp], dtype=bool)
+    values = table[by][is_country, y, :]
+    severity = np.abs(values) if by == 'gap' else np.abs(1 - values)
+    countries = cube.economies_jp[is_country]
     
-    merged = pd.merge(rich_df, poor_df, on='国', how='inner')
-    return merged
+    order = np.argsort(np.where(np.isnan(severity), -np.inf, severity), axis=0)[::-1][:top_k]
+    columns = np.broadcast_to(np.arange(values.shape[1]), order.shape)
+    top_severity = severity[order, columns]
+    keep = ~np.isnan(top_severity)
+    ranks = np.broadcast_to(np.arange(1, order.shape[0] + 1)[:, None], order.shape)
+    first_label, second_label = table['labels']
+    top = pd.DataFrame({
+        '指標': np.array(cube.indicators, dtype=object)[columns[keep]],
+        '順位': ranks[keep],
+        '国': countries[order[keep]],
+        first_label: table['first'][is_country, y, :][order, columns][keep],
+        second_label: table['second'][is_country, y, :][order, columns][keep],
+        '格差': table['gap'][is_country, y, :][order, columns][keep],
+        '比率': table['ratio'][is_country, y, :][order, columns][keep],
+    }).sort_values(['指標', '順位'])
+    
+    observed = (~np.isnan(severity)).sum(axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        summary = pd.DataFrame({
+            '指標': cube.indicators,
+            '対象国数': observed,
+            '平均格差' if by == 'gap' else '平均比率': np.nanmean(values, axis=0),
+            GAP_SEVERITY_LABELS[by]: np.nanmax(severity, axis=0),
+        })
+    summary = summary[summary['対象国数'] > 0].sort_values(GAP_SEVERITY_LABELS[by], ascending=False)
+    return top, summary
+
+def get_time_series_data(df, indicator_eng, countries, demographic_group='all', sub_groups=None):
+    """国 × 年の時系列行列を属性区分ごとに一括取得（複数区分は全区分が揃う年のみ）"""
+    sub_groups = sub_groups or {None: '値'}
+    cube = get_findex_cube(df)
+    frames = {}
+    if cube is not None and indicator_eng in cube.indicator_index:
+        years = sorted(y for y in cube.years if pd.notna(y))
+        year_ids = [cube.year_index[y] for y in years]
+        i = cube.indicator_index[indicator_eng]
+        for sub_group, name in sub_groups.items():
+            s = cube.slice_id(demographic_group, sub_group)
+            if s is None:
+                matrix = np.full((len(cube.economies), len(years)), np.nan)
+            else:
+                matrix = cube.values[:, s, year_ids, i]
+            frame = pd.DataFrame(matrix, index=cube.economies_jp, columns=years)
+            frame = frame[frame.index.notna()].groupby(level=0, sort=False).first()
+            frames[name] = frame.reindex(countries)
+    else:
+        years = sorted(y for y in df['Year'].unique() if pd.notna(y))
+        for sub_group, name in sub_groups.items():
+            mask = df['Demographic group'] == demographic_group
+            if sub_group is not None:
+                mask &= df['Demographic sub-group'] == sub_group
+            frame = df[mask].pivot_table(index='Economy_JP', columns='Year', values=indicator_eng,
+                                         aggfunc='first', observed=True) * 100
+            frames[name] = frame.reindex(index=countries, columns=years)
+
+    if len(frames) > 1:
+        complete = np.logical_and.reduce([frame.notna().to_numpy() for frame in frames.values()])
+        frames = {name: frame.where(complete) for name, frame in frames.items()}
+    return frames
+
+def _feature_matrix(df, countries, indicators, demographic_group, sub_group, year, country_key):
+    cube = get_findex_cube(df)
+    if cube is not None:
+        s = cube.slice_id(demographic_group, sub_group)
+        y = cube.year_index.get(year)
+        known = [ind for ind in indicators if ind in cube.indicator_index]
+        if s is None or y is None:
+            values = np.full((len(cube.economies), len(known)), np.nan)
+        else:
+            values = cube.values[:, s, y, [cube.indicator_index[ind] for ind in known]]
+        labels = cube.economies_jp if country_key == 'Economy_JP' else np.array(cube.economies, dtype=object)
+        table = pd.DataFrame(values, index=labels, columns=known)
+    else:
+        mask = (df['Demographic group'] == demographic_group) & (df['Year'] == year)
+        if sub_group is not None:
+            mask &= df['Demographic sub-group'] == sub_group
+        known = [ind for ind in indicators if ind in df.columns]
+        table = df.loc[mask, [country_key] + known].set_index(country_key) * 100
+
+    table = table[table.index.notna()].groupby(level=0, sort=False).first()
+    matrix = table.reindex(index=list(countries), columns=list(indicators)).to_numpy(dtype=float)
+    return matrix, np.isnan(matrix)
+
+@st.cache_data(show_spinner=False)
+def _cached_feature_matrix(dataset_version, countries, indicators, demographic_group, sub_group, year, country_key, _df):
+    return _feature_matrix(_df, countries, indicators, demographic_group, sub_group, year, country_key)
+
+def build_feature_matrix(df, countries, indicators, demographic_group='all', year=2024, sub_group=None,
+                         country_key='Economy_JP'):
+    """国 × 指標の値行列（%）と欠損マスクを一括取得（country_keyは'Economy_JP'または'Economy'）"""
+    version = df.attrs.get('dataset_version')
+    if version is None:
+        return _feature_matrix(df, countries, indicators, demographic_group, sub_group, year, country_key)
+    return _cached_feature_matrix(version, tuple(countries), tuple(indicators), demographic_group,
+                                  sub_group, year, country_key, df)
+
+def build_feature_tensor(df, countries, indicators, years, demographic_group='all', sub_group=None):
+    """国 × 年 × 指標の値（%）をキューブから一度の選択でまとめて取得"""
+    cube = get_findex_cube(df)
+    if cube is None:
+        return np.stack([build_feature_matrix(df, countries, indicators, demographic_group, year, sub_group)[0]
+                         for year in years], axis=1)
+    
+    values = np.full((len(cube.economies), len(years), len(indicators)), np.nan)
+    s = cube.slice_id(demographic_group, sub_group)
+    year_pos = [k for k, year in enumerate(years) if year in cube.year_index]
+    indicator_pos = [j for j, ind in enumerate(indicators) if ind in cube.indicator_index]
+    if s is not None and year_pos and indicator_pos:
+        selection = np.ix_(np.arange(len(cube.economies)),
+                           [cube.year_index[years[k]] for k in year_pos],
+                           [cube.indicator_index[indicators[j]] for j in indicator_pos])
+        values[np.ix_(np.arange(len(cube.economies)), year_pos, indicator_pos)] = cube.values[:, s][selection]
+    
+    table = pd.DataFrame(values.reshape(len(cube.economies), -1), index=cube.economies_jp)
+    table = table[table.index.notna()].groupby(level=0, sort=False).first()
+    return table.reindex(list(countries)).to_numpy(dtype=float).reshape(len(countries), len(years), len(indicators))
+
+IMPUTATION_METHODS = {
+    'なし（欠損のある国を除外）': None,
+    '中央値': 'median',
+    'KNN（近傍5カ国）': 'knn',
+    '反復補完（IterativeImputer）': 'iterative',
+}
+IMPUTATION_MIN_OBSERVED = 0.5
+
+def impute_matrix(matrix, method='median', min_observed=IMPUTATION_MIN_OBSERVED, n_neighbors=5):
+    """欠損セルを列単位のバッチ変換で補完し、(補完後の行列, 補完したセルのマスク) を返す
+    
+    観測済みの割合がmin_observed未満の行と、対象行で一度も観測されていない列は補完しない。
+    """
+    missing = np.isnan(matrix)
+    result = np.array(matrix, dtype=float)
+    rows = missing.mean(axis=1) <= 1 - min_observed
+    cols = ~missing[rows].all(axis=0)
+    if method is None or not missing[rows].any() or rows.sum() < 2 or not cols.any():
+        return result, np.zeros_like(missing)
+    
+    if method == 'median':
+        from sklearn.impute import SimpleImputer
+        imputer = SimpleImputer(strategy='median')
+    elif method == 'knn':
+        from sklearn.impute import KNNImputer
+        imputer = KNNImputer(n_neighbors=min(n_neighbors, int(rows.sum()) - 1))
+    elif method == 'iterative':
+        from sklearn.experimental import enable_iterative_imputer  # noqa: F401
+        from sklearn.impute import IterativeImputer
+        imputer = IterativeImputer(max_iter=10, random_state=42)
+    else:
+        raise ValueError(f"未対応の補完方法です: {method}")
+    
+    selection = np.ix_(rows, cols)
+    result[selection] = imputer.fit_transform(result[selection])
+    return result, missing & ~np.isnan(result)
+
+INDICATOR_CATEGORY_STYLES = {
+    '男女別': ('gender', {'men': '男性', 'women': '女性'},
+              {'男性': ('solid', 'blue'), '女性': ('dash', 'red')}),
+    '所得水準別': ('income', {'richest 60%': '富裕層60%', 'poorest 40%': '貧困層40%'},
+                {'富裕層60%': ('solid', 'green'), '貧困層40%': ('dash', 'orange')}),
+}
+
+def indicator_bar_figure(df, indicator, indicator_label, countries, category, year):
+    """指標の国別棒グラフと元データを返す（category: 全体・男女別・所得水準別、データが無ければfigはNone）"""
+    if category == "全体":
+        data = get_data_for_indicator(df, indicator, 'all', year)
+        data = data[data['国'].isin(countries)]
+        if data.empty:
+            return None, data
+        fig = px.bar(data, x='国', y='値', title=f"{indicator_label} ({year}年)",
+                    labels={'値': '割合 (%)'}, text='値')
+        fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+        return fig, data
+    
+    data = get_gender_data(df, indicator, year) if category == "男女別" else get_income_data(df, indicator, year)
+    data = data[data['国'].isin(countries)]
+    if data.empty:
+        return None, data
+    
+    _, _, styles = INDICATOR_CATEGORY_STYLES[category]
+    fig = go.Figure()
+    for name, (_, color) in styles.items():
+        fig.add_trace(go.Bar(name=name, x=data['国'], y=data[name], marker_color=color, text=data[name]))
+    fig.update_layout(title=f"{indicator_label} - {category}比較 ({year}年)", 
+                    xaxis_title="国名", yaxis_title="割合 (%)", barmode='group')
+    fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+    return fig, data
+
+def indicator_line_figure(df, indicator, indicator_label, countries, category):
+    """指標の時系列折れ線グラフを返す（category: 全体・男女別・所得水準別）"""
+    fig = go.Figure()
+    if category == "全体":
+        series = get_time_series_data(df, indicator, countries)
+        for country, y_values in series['値'].iterrows():
+            fig.add_trace(go.Scatter(x=y_values.index, y=y_values.values, mode='lines+markers', name=country,
+                                    line=dict(width=2), marker=dict(size=6), connectgaps=True))
+        fig.update_layout(title=f"{indicator_label} の時系列推移", xaxis_title="年", 
+                        yaxis_title="割合 (%)", hovermode='x unified')
+        return fig
+    
+    demographic_group, sub_groups, styles = INDICATOR_CATEGORY_STYLES[category]
+    series = get_time_series_data(df, indicator, countries, demographic_group, sub_groups)
+    for country in countries:
+        for name, (dash, color) in styles.items():
+            y_values = series[name].loc[country]
+            fig.add_trace(go.Scatter(x=y_values.index, y=y_values.values, mode='lines+markers',
+                                    name=f'{country}（{name}）', line=dict(width=2, dash=dash),
+                                    marker=dict(size=6, color=color)))
+    fig.update_layout(title=f"{indicator_label} の時系列推移（{category}）",
+                    xaxis_title="年", yaxis_title="割合 (%)", hovermode='x unified')
+    return fig
 
 def indicator_analysis(df):
     st.header("📈 指標別グラフ可視化")
@@ -303,7 +1233,7 @@ def indicator_analysis(df):
         if chart_type == "棒グラフ":
             category = st.selectbox("分析カテゴリを選択", ["全体", "男女別", "所得水準別"], key="category_bar")
         else:
-            category = st.selectbox("分析カテゴリを選択", ["全体"], key="category_line")
+            category = st.selectbox("分析カテゴリを選択", ["全体", "男女別", "所得水準別"], key="category_line")
     
     selected_countries = selected_ca + selected_comp
     
@@ -312,167 +1242,594 @@ def indicator_analysis(df):
         return
     
     if chart_type == "棒グラフ":
-        available_years = sorted([int(y) for y in df['Year'].unique() if pd.notna(y)])
+        available_years = get_findex_metadata(df).years
         if available_years:
             year = st.select_slider("表示年を選択", options=available_years, value=available_years[-1])
         else:
             st.error("データに利用可能な年がありません")
             return
         
-        if category == "全体":
-            data = get_data_for_indicator(df, indicator_eng, 'all', year)
-            data = data[data['国'].isin(selected_countries)]
-            
-            fig = px.bar(data, x='国', y='値', title=f"{selected_indicator_jp} ({year}年)",
-                        labels={'値': '割合 (%)'}, text='値')
-            fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-            
-        elif category == "男女別":
-            data = get_gender_data(df, indicator_eng, year)
-            data = data[data['国'].isin(selected_countries)]
-            
-            if data.empty:
-                st.warning(f"選択した国・年度（{year}年）の男女別データが見つかりません。別の年を選択してください。")
-                return
-            
-            fig = go.Figure()
-            fig.add_trace(go.Bar(name='男性', x=data['国'], y=data['男性'], marker_color='blue', text=data['男性']))
-            fig.add_trace(go.Bar(name='女性', x=data['国'], y=data['女性'], marker_color='red', text=data['女性']))
-            fig.update_layout(title=f"{selected_indicator_jp} - 男女別比較 ({year}年)", 
-                            xaxis_title="国名", yaxis_title="割合 (%)", barmode='group')
-            fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-            
-        else:
-            income_data = get_income_data(df, indicator_eng, year)
-            if income_data.empty:
-                st.warning(f"選択した年度（{year}年）の所得水準別データが見つかりません。別の年を選択してください。")
-                return
-            
-            data = income_data[income_data['国'].isin(selected_countries)]
-            if data.empty:
-                st.warning(f"選択した国の所得水準別データが見つかりません。")
-                return
-            
-            fig = go.Figure()
-            fig.add_trace(go.Bar(name='富裕層60%', x=data['国'], y=data['富裕層60%'], marker_color='green', text=data['富裕層60%']))
-            fig.add_trace(go.Bar(name='貧困層40%', x=data['国'], y=data['貧困層40%'], marker_color='orange', text=data['貧困層40%']))
-            fig.update_layout(title=f"{selected_indicator_jp} - 所得水準別比較 ({year}年)", 
-                            xaxis_title="国名", yaxis_title="割合 (%)", barmode='group')
-            fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-        
-        st.plotly_chart(fig, use_container_width=True)
-        
+        fig, _ = indicator_bar_figure(df, indicator_eng, selected_indicator_jp, selected_countries, category, year)
+        if fig is None:
+            st.warning(f"選択した国・年度（{year}年）の{category}データが見つかりません。別の年を選択してください。")
+            return
     else:
-        years = sorted(df['Year'].unique())
-        
-        if category == "全体":
-            fig = go.Figure()
-            for country in selected_countries:
-                y_values = []
-                for year in years:
-                    data = get_data_for_indicator(df, indicator_eng, 'all', year)
-                    data = data[data['国'] == country]
-                    if not data.empty:
-                        y_values.append(data['値'].values[0])
-                    else:
-                        y_values.append(None)
-                
-                fig.add_trace(go.Scatter(x=years, y=y_values, mode='lines+markers', name=country,
-                                        line=dict(width=2), marker=dict(size=6), connectgaps=True))
-            
-            fig.update_layout(title=f"{selected_indicator_jp} の時系列推移", xaxis_title="年", 
-                            yaxis_title="割合 (%)", hovermode='x unified')
-            
-        elif category == "男女別":
-            fig = go.Figure()
-            for country in selected_countries:
-                male_values = []
-                female_values = []
-                for year in years:
-                    data = get_gender_data(df, indicator_eng, year)
-                    data = data[data['国'] == country]
-                    if not data.empty:
-                        male_values.append(data['男性'].values[0])
-                        female_values.append(data['女性'].values[0])
-                    else:
-                        male_values.append(None)
-                        female_values.append(None)
-                
-                fig.add_trace(go.Scatter(x=years, y=male_values, mode='lines+markers',
-                                        name=f'{country}（男性）', line=dict(width=2, dash='solid'),
-                                        marker=dict(size=6, color='blue')))
-                fig.add_trace(go.Scatter(x=years, y=female_values, mode='lines+markers',
-                                        name=f'{country}（女性）', line=dict(width=2, dash='dash'),
-                                        marker=dict(size=6, color='red')))
-            
-            fig.update_layout(title=f"{selected_indicator_jp} の時系列推移（男女別）",
-                            xaxis_title="年", yaxis_title="割合 (%)", hovermode='x unified')
-        
-        st.plotly_chart(fig, use_container_width=True)
+        fig = indicator_line_figure(df, indicator_eng, selected_indicator_jp, selected_countries, category)
+    
+    plotly_chart(fig, use_container_width=True)
+
+def gap_ranking(df):
+    st.header("⚖️ 格差ランキング（全指標）")
+    
+    years = get_findex_metadata(df).years
+    if not years:
+        st.error("データに利用可能な年がありません")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        split = st.selectbox("格差の種類", list(GAP_DEFINITIONS.keys()), key='gap_split')
+    with col2:
+        year = st.select_slider("表示年を選択", options=years, value=years[-1], key='gap_year')
+    with col3:
+        measure = st.radio("並べ替えの基準", ["格差（差）", "比率"], horizontal=True, key='gap_measure')
+    top_k = st.slider("指標ごとに表示する国数", 3, 20, 5, key='gap_top_k')
+    
+    by = 'gap' if measure == "格差（差）" else 'ratio'
+    top, summary = rank_gaps(df, split, year, by, top_k)
+    if summary.empty:
+        st.warning(f"選択した年度（{year}年）の{split}データが見つかりません。別の年を選択してください。")
+        return
+    
+    first_label, second_label = GAP_DEFINITIONS[split]['sub_groups'].values()
+    if by == 'gap':
+        st.caption(f"格差 = {first_label} − {second_label}（%ポイント）")
+    else:
+        st.caption(f"比率 = {second_label} ÷ {first_label}（1に近いほど格差が小さい）")
+    
+    st.subheader("📊 格差の大きい指標（上位20）")
+    severity_label = GAP_SEVERITY_LABELS[by]
+    fig = px.bar(summary.head(20), x=severity_label, y='指標', orientation='h',
+                 title=f"{split}の格差が大きい指標 ({year}年)")
+    fig.update_layout(yaxis=dict(autorange='reversed'), height=600)
+    plotly_chart(fig, use_container_width=True)
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    
+    st.subheader("🏛️ 指標別の格差上位国")
+    indicator = st.selectbox("指標を選択", summary['指標'].tolist(), key='gap_indicator')
+    st.dataframe(top[top['指標'] == indicator].drop(columns='指標'), use_container_width=True, hide_index=True)
+
+SIMILARITY_INDICATORS = [ind for group in INDICATOR_GROUPS.values() for ind in group.values()]
+
+def _similarity_index(df, year, indicators, min_overlap):
+    countries = _economy_names()
+    matrix, missing = build_feature_matrix(df, countries, indicators, 'all', year)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        z = (matrix - np.nanmean(matrix, axis=0)) / np.nanstd(matrix, axis=0)
+    observed = (~missing & np.isfinite(z)).astype(float)
+    z = np.where(observed > 0, z, 0.0)
+    
+    common = observed @ observed.T
+    squared = z ** 2
+    sum_sq = squared @ observed.T + observed @ squared.T - 2 * z @ z.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distances = np.sqrt(np.maximum(sum_sq, 0) / common)
+    distances[common < min_overlap] = np.nan
+    np.fill_diagonal(distances, np.nan)
+    return countries, distances, common
+
+@st.cache_data(show_spinner=False)
+def _cached_similarity_index(dataset_version, year, indicators, min_overlap, _df):
+    return _similarity_index(_df, year, indicators, min_overlap)
+
+def build_similarity_index(df, year=2024, indicators=None, min_overlap=3):
+    """標準化した指標ベクトルの経済圏間距離行列を作る
+    
+    欠損は国を落とさず、2国がともに観測している指標だけで二乗平均平方根距離を計算する。
+    共通の指標がmin_overlap未満の組はNaN。戻り値は (国名リスト, 距離行列, 共通指標数行列)。
+    """
+    indicators = tuple(indicators or SIMILARITY_INDICATORS)
+    version = df.attrs.get('dataset_version')
+    if version is None:
+        return _similarity_index(df, year, indicators, min_overlap)
+    return _cached_similarity_index(version, year, indicators, min_overlap, df)
+
+def find_similar_economies(df, country, year=2024, indicators=None, k=5, min_overlap=3):
+    """指定国に最も近い上位k経済圏を距離の小さい順に返す"""
+    countries, distances, common = build_similarity_index(df, year, indicators, min_overlap)
+    if country not in countries:
+        return pd.DataFrame(columns=['国', '距離', '共通指標数'])
+    i = countries.index(country)
+    row = distances[i]
+    candidates = np.flatnonzero(~np.isnan(row))
+    nearest = candidates[np.argsort(row[candidates])[:k]]
+    return pd.DataFrame({
+        '国': [countries[j] for j in nearest],
+        '距離': row[nearest],
+        '共通指標数': common[i, nearest].astype(int),
+    })
+
+COUNTRY_PROFILE_INDICATORS = {
+    '口座保有率': 'Account (%, age 15+)',
+    'デジタル決済': 'Made a digital payment (%, age 15+)',
+    '携帯電話保有': 'Own a mobile phone (%, age 15+)',
+    'インターネット利用': 'Used the internet in the past three months (%, age 15+)',
+    '貯蓄率': 'Saved any money (%, age 15+)',
+    '借入経験': 'Borrowed any money (%, age 15+)'
+}
+
+COUNTRY_PROFILE_PANELS = [("💳 口座・決済", ['口座保有率', 'デジタル決済']),
+                          ("📱 デジタル利用", ['携帯電話保有', 'インターネット利用']),
+                          ("💰 貯蓄・借入", ['貯蓄率', '借入経験'])]
+
+def _profile_ranks(table, groups=None):
+    """列ごとの降順の順位・比較国数・パーセンタイル（groups指定時はグループ内）"""
+    ranked = table.groupby(groups, sort=False) if groups is not None else table
+    position = ranked.rank(ascending=False, method='min')
+    percentile = ranked.rank(pct=True) * 100
+    if groups is None:
+        peers = np.broadcast_to(table.notna().sum().to_numpy(), table.shape)
+    else:
+        peers = table.notna().groupby(groups, sort=False).transform('sum').to_numpy()
+    return position.to_numpy(), np.where(table.notna(), peers, 0), percentile.to_numpy()
+
+def build_country_profiles(df):
+    """全経済圏 × 全調査年のプロファイル指標と、世界・地域グループ内での順位を一括計算する
+    
+    地域グループはREGION_GROUPSの所属で決め、どのグループにも属さない国は地域内順位を持たない。
+    配列は (国, 年, 指標) の並びで、地域平均などの集計値は比較対象に含めない。
+    """
+    countries = _economy_names()
+    years = get_findex_metadata(df).years
+    indicators = [ind for ind in COUNTRY_PROFILE_INDICATORS.values() if ind in get_all_indicators(df)]
+    labels = [label for label, ind in COUNTRY_PROFILE_INDICATORS.items() if ind in indicators]
+    values = build_feature_tensor(df, countries, indicators, years)
+    membership = {c: group for group, members in REGION_GROUPS.items() for c in members}
+    regions = np.array([membership.get(c) for c in countries], dtype=object)
+    
+    table = pd.DataFrame(values.reshape(len(countries), -1))
+    world = _profile_ranks(table)
+    in_region = pd.notna(regions)
+    region = [np.full(values.shape, np.nan) for _ in range(3)]
+    if in_region.any():
+        ranks = _profile_ranks(table[in_region].reset_index(drop=True), regions[in_region])
+        for full, part in zip(region, ranks):
+            full[in_region] = part.reshape(-1, *values.shape[1:])
+    
+    shape = values.shape
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        world_median = np.nanmedian(values, axis=0)
+    return {
+        'countries': countries,
+        'country_index': {c: i for i, c in enumerate(countries)},
+        'years': years,
+        'year_index': {y: k for k, y in enumerate(years)},
+        'labels': labels,
+        'regions': regions,
+        'values': values,
+        'world_rank': world[0].reshape(shape),
+        'world_peers': world[1].reshape(shape),
+        'world_percentile': world[2].reshape(shape),
+        'region_rank': region[0],
+        'region_peers': region[1],
+        'region_percentile': region[2],
+        'world_median': world_median,
+    }
+
+@st.cache_resource(show_spinner=False)
+def _cached_country_profiles(dataset_version, _df):
+    return build_country_profiles(_df)
+
+def get_country_profiles(df):
+    """データセットごとに一度だけ作る国別プロファイル表"""
+    version = df.attrs.get('dataset_version')
+    if version is None:
+        return build_country_profiles(df)
+    return _cached_country_profiles(version, df)
+
+def country_profile_table(df, country, year):
+    """国・年のプロファイル指標と、世界・地域グループ内の順位を1行1指標で返す（データが無い指標は含まない）"""
+    profiles = get_country_profiles(df)
+    i = profiles['country_index'].get(country)
+    k = profiles['year_index'].get(year)
+    if i is None or k is None:
+        return pd.DataFrame(columns=['指標', '値', '世界順位', '世界の比較国数', '世界パーセンタイル',
+                                     '地域順位', '地域の比較国数', '地域パーセンタイル', '世界の中央値'])
+    table = pd.DataFrame({
+        '指標': profiles['labels'],
+        '値': profiles['values'][i, k],
+        '世界順位': profiles['world_rank'][i, k],
+        '世界の比較国数': profiles['world_peers'][i, k],
+        '世界パーセンタイル': profiles['world_percentile'][i, k],
+        '地域順位': profiles['region_rank'][i, k],
+        '地域の比較国数': profiles['region_peers'][i, k],
+        '地域パーセンタイル': profiles['region_percentile'][i, k],
+        '世界の中央値': profiles['world_median'][k],
+    })
+    return table[table['値'].notna()].reset_index(drop=True)
+
+def country_profile_values(df, country, year):
+    """国のプロファイル指標を {ラベル: 値(%)} で返す（データが無い指標は含まない）"""
+    table = country_profile_table(df, country, year)
+    return dict(zip(table['指標'], table['値']))
+
+def country_region_group(df, country):
+    """プロファイル表で国が属する地域グループ（REGION_GROUPS外ならNone）"""
+    profiles = get_country_profiles(df)
+    i = profiles['country_index'].get(country)
+    return profiles['regions'][i] if i is not None else None
+
+def rank_badge(rank, peers):
+    """順位を「上位X%」のバッジ文言と色にする"""
+    share = rank / peers * 100
+    color = 'green' if share <= 25 else 'blue' if share <= 50 else 'orange' if share <= 75 else 'red'
+    return f"{int(rank)}/{int(peers)}位（上位{share:.0f}%）", color
+
+def country_radar_figure(values, country, reference=None):
+    fig = go.Figure(data=go.Scatterpolar(r=list(values.values()), theta=list(values.keys()), fill='toself',
+                                         name=country))
+    if reference:
+        fig.add_trace(go.Scatterpolar(r=[reference.get(label) for label in values], theta=list(values.keys()),
+                                      name="世界の中央値", line=dict(dash='dash')))
+    fig.update_layout(polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
+                     title=f"{country} の金融包摂プロファイル")
+    return fig
 
 def country_profile(df):
     st.header("🌍 国別プロファイル分析")
     
-    selected_country = st.selectbox("分析対象国を選択", CENTRAL_AMERICA + ['日本', '中国', 'ベトナム', 'インド', 'ケニア', '英国', '米国'])
-    year = st.slider("表示年を選択", 2011, 2024, 2024, step=1)
+    profiles = get_country_profiles(df)
+    countries = CENTRAL_AMERICA + sorted(c for c in profiles['countries'] if c not in CENTRAL_AMERICA)
+    countries = [c for c in countries if c in profiles['country_index']]
+    selected_country = st.selectbox("分析対象国を選択", countries)
+    years = profiles['years'] or [2024]
+    year = st.select_slider("表示年を選択", options=years, value=years[-1])
     
     st.subheader(f"📊 {selected_country} の金融包摂指標プロファイル ({year}年)")
     
-    indicators_for_radar = {
-        '口座保有率': 'Account (%, age 15+)',
-        'デジタル決済': 'Made a digital payment (%, age 15+)',
-        '携帯電話保有': 'Own a mobile phone (%, age 15+)',
-        'インターネット利用': 'Used the internet in the past three months (%, age 15+)',
-        '貯蓄率': 'Saved any money (%, age 15+)',
-        '借入経験': 'Borrowed any money (%, age 15+)'
+    table = country_profile_table(df, selected_country, year)
+    if table.empty:
+        st.info(f"{year}年の {selected_country} のデータはありません")
+    else:
+        values = dict(zip(table['指標'], table['値']))
+        reference = dict(zip(table['指標'], table['世界の中央値']))
+        plotly_chart(country_radar_figure(values, selected_country, reference), use_container_width=True)
+    
+    region = country_region_group(df, selected_country)
+    rows = table.set_index('指標')
+    for col, (title, labels) in zip(st.columns(3), COUNTRY_PROFILE_PANELS):
+        with col:
+            st.subheader(title)
+            for label in labels:
+                if label not in rows.index:
+                    continue
+                row = rows.loc[label]
+                st.metric(label, f"{row['値']:.1f}%")
+                text, color = rank_badge(row['世界順位'], row['世界の比較国数'])
+                st.badge(f"世界 {text}", color=color)
+                if region is not None and pd.notna(row['地域順位']):
+                    text, color = rank_badge(row['地域順位'], row['地域の比較国数'])
+                    st.badge(f"{region} {text}", color=color)
+    
+    if not table.empty:
+        with st.expander("🏅 順位の一覧"):
+            st.caption("順位は値の大きい順。パーセンタイルはその国以下の国の割合（地域平均などの集計値は含めない）"
+                       + ("" if region else "。この国はどの地域グループにも属さないため地域内順位はありません"))
+            st.dataframe(table, use_container_width=True, hide_index=True)
+    
+    st.subheader(f"🔗 {selected_country} に似た国・地域 ({year}年)")
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        similarity_groups = st.multiselect("類似度の計算に使う指標グループ", list(INDICATOR_GROUPS.keys()),
+                                           default=list(INDICATOR_GROUPS.keys()), key='similarity_groups')
+    with col2:
+        top_k = st.slider("表示する国数", 3, 20, 5, key='similarity_k')
+    similarity_indicators = [ind for group in similarity_groups for ind in INDICATOR_GROUPS[group].values()]
+    if len(similarity_indicators) < 3:
+        st.info("少なくとも3指標を含むグループを選択してください")
+        return
+    similar = find_similar_economies(df, selected_country, year, similarity_indicators, k=top_k)
+    if similar.empty:
+        st.info(f"{year}年のデータでは類似国を計算できません")
+    else:
+        st.caption("距離は各指標を標準化したうえで、両国が共通して観測している指標の二乗平均平方根（小さいほど類似）")
+        st.dataframe(similar, use_container_width=True, hide_index=True)
+
+CORRELATION_METHODS = {'ピアソン': 'pearson', 'スピアマン（順位）': 'spearman'}
+CORRELATION_MIN_PAIRS = 5
+
+def indicator_display_name(indicator):
+    """INDICATOR_GROUPSの日本語名（なければ英語名から「(%, age 15+)」を除いたもの）"""
+    for group_indicators in INDICATOR_GROUPS.values():
+        for label, eng in group_indicators.items():
+            if eng == indicator:
+                return label
+    return indicator.replace('(%, age 15+)', '').strip()
+
+def _column_ranks(matrix):
+    """列ごとの平均順位（欠損はNaNのまま）"""
+    return pd.DataFrame(matrix).rank(axis=0).to_numpy()
+
+def nan_correlation(matrix, method='pearson', min_pairs=CORRELATION_MIN_PAIRS):
+    """列の全組み合わせについて、両方が観測されている行だけを使う相関係数を行列演算で一括計算する
+    
+    method='spearman'では列ごとに観測値の順位を取ってからピアソン相関を計算する（順位は組ごとに
+    付け直さないため、欠損の多い列では厳密な値と僅かにずれる）。
+    戻り値は (相関行列, 組ごとの観測数)。観測数がmin_pairs未満または分散0の組はNaN。
+    """
+    values = _column_ranks(matrix) if method == 'spearman' else np.asarray(matrix, dtype=float)
+    observed = ~np.isnan(values)
+    # 桁落ちを避けるため列ごとに中心化してから積和を取る
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        values = values - np.nanmean(values, axis=0)
+    mask = observed.astype(float)
+    x = np.where(observed, values, 0.0)
+    
+    pairs = mask.T @ mask
+    sum_x = x.T @ mask
+    sum_xx = (x ** 2).T @ mask
+    sum_xy = x.T @ x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = pairs * sum_xy - sum_x * sum_x.T
+        var = pairs * sum_xx - sum_x ** 2
+        corr = cov / np.sqrt(var * var.T)
+    corr[(pairs < min_pairs) | ~np.isfinite(corr)] = np.nan
+    np.clip(corr, -1, 1, out=corr)
+    return corr, pairs.astype(int)
+
+def cluster_order(corr):
+    """1−|相関| を距離とする平均連結法の階層クラスタリングで、似た指標が隣り合う並び順を返す"""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+    
+    if len(corr) < 3:
+        return np.arange(len(corr))
+    distance = 1 - np.abs(np.nan_to_num(corr, nan=0.0))
+    np.fill_diagonal(distance, 0)
+    return leaves_list(linkage(squareform(distance, checks=False), method='average'))
+
+def _correlation(df, countries, year, method, min_pairs):
+    indicators = get_all_indicators(df)
+    matrix, _ = build_feature_matrix(df, list(countries), indicators, 'all', year)
+    keep = np.flatnonzero((~np.isnan(matrix)).sum(axis=0) >= min_pairs)
+    corr, pairs = nan_correlation(matrix[:, keep], method, min_pairs)
+    # 他のどの指標とも相関を計算できない列は除く
+    valid = np.flatnonzero((~np.isnan(corr)).sum(axis=1) > 1)
+    corr, pairs = corr[np.ix_(valid, valid)], pairs[np.ix_(valid, valid)]
+    return {
+        'indicators': [indicators[keep[j]] for j in valid],
+        'corr': corr,
+        'pairs': pairs,
+        'order': cluster_order(corr),
+        'n_countries': int((~np.isnan(matrix)).any(axis=1).sum()),
     }
+
+@st.cache_data(show_spinner=False)
+def _cached_correlation(dataset_version, countries, year, method, min_pairs, _df):
+    return _correlation(_df, countries, year, method, min_pairs)
+
+def correlation_matrix(df, countries, year, method='pearson', min_pairs=CORRELATION_MIN_PAIRS):
+    """全指標（(%, age 15+)）の相関行列を国グループ・年・手法ごとに一度だけ計算する
     
-    values = []
-    labels = []
-    for label, indicator in indicators_for_radar.items():
-        data = get_data_for_indicator(df, indicator, 'all', year)
-        country_data = data[data['国'] == selected_country]
-        if not country_data.empty:
-            values.append(country_data['値'].values[0])
-            labels.append(label)
+    戻り値は {'indicators', 'corr', 'pairs', 'order', 'n_countries'}。orderはクラスタリング順の添字。
+    """
+    version = df.attrs.get('dataset_version')
+    if version is None:
+        return _correlation(df, countries, year, method, min_pairs)
+    return _cached_correlation(version, tuple(countries), year, method, min_pairs, df)
+
+def top_correlated(result, indicator, k=10, absolute=True):
+    """指定した指標と相関の強い上位k指標（absolute=Trueなら相関の絶対値順）"""
+    indicators = result['indicators']
+    if indicator not in indicators:
+        return pd.DataFrame(columns=['指標', '相関係数', '観測国数'])
+    i = indicators.index(indicator)
+    row = result['corr'][i].copy()
+    row[i] = np.nan
+    score = np.abs(row) if absolute else row
+    score = np.where(np.isnan(score), -np.inf, score)
+    k = min(k, int(np.isfinite(score).sum()))
+    if k == 0:
+        return pd.DataFrame(columns=['指標', '相関係数', '観測国数'])
+    top = np.argpartition(-score, k - 1)[:k]
+    top = top[np.argsort(-score[top])]
+    return pd.DataFrame({
+        '指標': [indicator_display_name(indicators[j]) for j in top],
+        '相関係数': row[top],
+        '観測国数': result['pairs'][i, top],
+    })
+
+def top_correlated_pairs(result, k=20):
+    """相関の絶対値が大きい指標の組の上位k件"""
+    corr = result['corr']
+    upper = np.triu_indices(len(corr), k=1)
+    score = np.abs(corr[upper])
+    finite = np.flatnonzero(~np.isnan(score))
+    k = min(k, len(finite))
+    if k == 0:
+        return pd.DataFrame(columns=['指標1', '指標2', '相関係数', '観測国数'])
+    top = finite[np.argpartition(-score[finite], k - 1)[:k]]
+    top = top[np.argsort(-score[top])]
+    rows, cols = upper[0][top], upper[1][top]
+    indicators = result['indicators']
+    return pd.DataFrame({
+        '指標1': [indicator_display_name(indicators[i]) for i in rows],
+        '指標2': [indicator_display_name(indicators[j]) for j in cols],
+        '相関係数': corr[rows, cols],
+        '観測国数': result['pairs'][rows, cols],
+    })
+
+def correlation_heatmap_figure(result, year, method_label):
+    """クラスタリング順に並べた相関行列のヒートマップ"""
+    order = result['order']
+    labels = [indicator_display_name(result['indicators'][j]) for j in order]
+    fig = px.imshow(result['corr'][np.ix_(order, order)], x=labels, y=labels, zmin=-1, zmax=1,
+                    color_continuous_scale='RdBu_r', aspect='auto',
+                    title=f"指標間の相関（{method_label}・{year}年・クラスタリング順）")
+    fig.update_layout(height=max(500, min(1600, 14 * len(labels))))
+    fig.update_xaxes(showticklabels=len(labels) <= 80)
+    fig.update_yaxes(showticklabels=len(labels) <= 80)
+    return fig
+
+def correlation_explorer(df):
+    st.header("🧮 指標間の相関")
     
-    if values:
-        fig = go.Figure(data=go.Scatterpolar(r=values, theta=labels, fill='toself', name=selected_country))
-        fig.update_layout(polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
-                         title=f"{selected_country} の金融包摂プロファイル")
-        st.plotly_chart(fig, use_container_width=True)
+    years = get_findex_metadata(df).years
+    if not years:
+        st.error("データに利用可能な年がありません")
+        return
     
+    country_groups = {'全経済圏（集計値を除く）': _economy_names(), **REGION_GROUPS}
     col1, col2, col3 = st.columns(3)
-    
     with col1:
-        st.subheader("💳 口座・決済")
-        for label, indicator in [('口座保有率', 'Account (%, age 15+)'), 
-                                ('デジタル決済', 'Made a digital payment (%, age 15+)')]:
-            data = get_data_for_indicator(df, indicator, 'all', year)
-            country_data = data[data['国'] == selected_country]
-            if not country_data.empty:
-                st.metric(label, f"{country_data['値'].values[0]:.1f}%")
-    
+        group = st.selectbox("国グループ", list(country_groups), key='corr_group')
     with col2:
-        st.subheader("📱 デジタル利用")
-        for label, indicator in [('携帯電話保有', 'Own a mobile phone (%, age 15+)'),
-                                ('インターネット利用', 'Used the internet in the past three months (%, age 15+)')]:
-            data = get_data_for_indicator(df, indicator, 'all', year)
-            country_data = data[data['国'] == selected_country]
-            if not country_data.empty:
-                st.metric(label, f"{country_data['値'].values[0]:.1f}%")
+        year = st.select_slider("表示年を選択", options=years, value=years[-1], key='corr_year')
+    with col3:
+        method_label = st.radio("相関の種類", list(CORRELATION_METHODS), horizontal=True, key='corr_method')
+    
+    with perf_stage('correlation'):
+        result = correlation_matrix(df, country_groups[group], year, CORRELATION_METHODS[method_label])
+    if len(result['indicators']) < 2:
+        st.warning(f"{year}年の{group}では相関を計算できる指標がありません（各組に{CORRELATION_MIN_PAIRS}カ国以上の観測が必要）")
+        return
+    st.caption(f"{result['n_countries']}カ国・{len(result['indicators'])}指標。各組は両方の指標を観測している国だけで計算"
+               f"（{CORRELATION_MIN_PAIRS}カ国未満の組は空欄）")
     
+    plotly_chart(correlation_heatmap_figure(result, year, method_label), use_container_width=True)
+    
+    st.subheader("🎯 特定の指標と相関の強い指標")
+    names = {indicator_display_name(ind): ind for ind in result['indicators']}
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        label = st.selectbox("基準の指標", list(names), key='corr_indicator')
+    with col2:
+        top_k = st.slider("表示数", 5, 30, 10, key='corr_top_k')
     with col3:
-        st.subheader("💰 貯蓄・借入")
-        for label, indicator in [('貯蓄率', 'Saved any money (%, age 15+)'),
-                                ('借入経験', 'Borrowed any money (%, age 15+)')]:
-            data = get_data_for_indicator(df, indicator, 'all', year)
-            country_data = data[data['国'] == selected_country]
-            if not country_data.empty:
-                st.metric(label, f"{country_data['値'].values[0]:.1f}%")
+        absolute = st.checkbox("負の相関も含める", value=True, key='corr_absolute')
+    top = top_correlated(result, names[label], top_k, absolute)
+    if top.empty:
+        st.info("この指標と相関を計算できる指標がありません")
+    else:
+        fig = px.bar(top, x='相関係数', y='指標', orientation='h', range_x=[-1, 1],
+                     title=f"{label} と相関の強い指標 ({year}年)")
+        fig.update_layout(yaxis=dict(autorange='reversed'))
+        plotly_chart(fig, use_container_width=True)
+        st.dataframe(top, use_container_width=True, hide_index=True)
+    
+    st.subheader("🔗 相関の強い指標の組（上位20）")
+    st.dataframe(top_correlated_pairs(result), use_container_width=True, hide_index=True)
+
+def _fit_pca(matrix, n_components=2):
+    from sklearn.decomposition import PCA
+    from sklearn.preprocessing import StandardScaler
+    
+    scaler = StandardScaler().fit(matrix)
+    pca = PCA(n_components=n_components).fit(scaler.transform(matrix))
+    return scaler, pca
+
+def _pca_engine(df, countries, indicators, years, pooled, imputation):
+    tensor = build_feature_tensor(df, countries, indicators, years)
+    recovered = np.zeros((len(countries), len(years)), dtype=bool)
+    imputed_cells = np.zeros(len(years), dtype=int)
+    if imputation is not None:
+        tensor = tensor.copy()
+        for k in range(len(years)):
+            before = ~np.isnan(tensor[:, k]).any(axis=1)
+            tensor[:, k], imputed = impute_matrix(tensor[:, k], imputation)
+            recovered[:, k] = ~before & ~np.isnan(tensor[:, k]).any(axis=1)
+            imputed_cells[k] = imputed.sum()
+    complete = ~np.isnan(tensor).any(axis=2)
+    results = {}
+    
+    if pooled:
+        if complete.sum() < 3:
+            return results
+        scaler, pca = _fit_pca(tensor[complete])
+        loadings = pca.components_.T * np.sqrt(pca.explained_variance_)
+    
+    for k, year in enumerate(years):
+        rows = np.flatnonzero(complete[:, k])
+        if len(rows) < 3:
+            continue
+        if not pooled:
+            scaler, pca = _fit_pca(tensor[rows, k])
+            loadings = pca.components_.T * np.sqrt(pca.explained_variance_)
+        results[year] = {
+            'countries': [countries[r] for r in rows],
+            'scores': pca.transform(scaler.transform(tensor[rows, k])),
+            'loadings': loadings,
+            'explained': pca.explained_variance_ratio_,
+            'imputed_countries': [countries[r] for r in np.flatnonzero(recovered[:, k])],
+            'imputed_cells': int(imputed_cells[k]),
+        }
+    
+    if not pooled and results:
+        reference = results[max(results)]['loadings']
+        for result in results.values():
+            signs = np.sign(np.sum(result['loadings'] * reference, axis=0))
+            signs[signs == 0] = 1
+            result['scores'] = result['scores'] * signs
+            result['loadings'] = result['loadings'] * signs
+    return results
+
+@st.cache_data(show_spinner=False)
+def _cached_pca_engine(dataset_version, countries, indicators, years, pooled, imputation, _df):
+    return _pca_engine(_df, countries, indicators, years, pooled, imputation)
+
+def fit_pca_by_year(df, countries, indicators, years=None, pooled=False, imputation=None):
+    """全調査年のPCAを一括で計算してキャッシュする
+    
+    pooled=Falseでは年ごとに標準化・PCAを行い、成分の符号を最新年に揃える。
+    pooled=Trueでは全年の国データをまとめて1つの軸を作り、各年をその軸に射影する。
+    imputationに'median'・'knn'・'iterative'を指定すると、年ごとに欠損を補完してから計算する。
+    戻り値は {年: {'countries', 'scores', 'loadings', 'explained', 'imputed_countries', 'imputed_cells'}}
+    （3カ国未満の年は含まない）。
+    """
+    years = tuple(years or get_findex_metadata(df).years)
+    version = df.attrs.get('dataset_version')
+    if version is None:
+        return _pca_engine(df, list(countries), list(indicators), years, pooled, imputation)
+    return _cached_pca_engine(version, tuple(countries), tuple(indicators), years, pooled, imputation, df)
+
+def pca_biplot_figure(result, indicator_labels, year):
+    """fit_pca_by_yearの1年分の結果から、国の主成分得点と指標の負荷量を重ねた散布図を作る"""
+    scores = result['scores']
+    loadings = result['loadings']
+    explained = result['explained']
+    fig = go.Figure()
+    
+    fig.add_trace(go.Scatter(x=scores[:, 0], y=scores[:, 1],
+                            mode='markers+text', text=result['countries'],
+                            textposition="top center", name='国',
+                            marker=dict(size=12, color='blue')))
+    
+    fig.add_trace(go.Scatter(x=loadings[:, 0], y=loadings[:, 1],
+                            mode='markers+text', text=indicator_labels,
+                            textposition="top center", name='指標',
+                            marker=dict(size=10, color='red', symbol='diamond')))
+    
+    fig.add_hline(y=0, line_dash="dash", line_color="gray")
+    fig.add_vline(x=0, line_dash="dash", line_color="gray")
+    
+    fig.update_layout(title=f"主成分分析結果（PCA: {year}年）",
+                     xaxis_title=f"第1主成分 ({explained[0]*100:.1f}%)",
+                     yaxis_title=f"第2主成分 ({explained[1]*100:.1f}%)",
+                     showlegend=True, height=600)
+    return fig
+
+def pca_loadings_table(result, indicator_labels, component=0):
+    """指定した主成分の負荷量を絶対値の大きい順に並べた表を返す"""
+    return pd.DataFrame({
+        '指標': indicator_labels,
+        '負荷量': result['loadings'][:, component]
+    }).sort_values('負荷量', key=lambda x: x.abs(), ascending=False)
 
 def correspondence_analysis(df):
-    st.header("🔍 主成分分析（PCA：2024年データ）")
+    st.header("🔍 主成分分析（PCA）")
     
     col1, col2 = st.columns(2)
     
@@ -512,80 +1869,65 @@ def correspondence_analysis(df):
     for group_indicators in INDICATOR_GROUPS.values():
         indicator_mapping.update(group_indicators)
     
-    data_matrix = []
-    valid_countries = []
-    
-    for country in selected_countries:
-        row = []
-        for indicator_jp in selected_indicators_jp:
-            indicator_eng = indicator_mapping[indicator_jp]
-            data = get_data_for_indicator(df, indicator_eng, 'all', 2024)
-            country_data = data[data['国'] == country]
-            if not country_data.empty:
-                row.append(country_data['値'].values[0])
-            else:
-                row.append(np.nan)
-        
-        if not any(np.isnan(row)):
-            data_matrix.append(row)
-            valid_countries.append(country)
+    indicators_eng = [indicator_mapping[indicator_jp] for indicator_jp in selected_indicators_jp]
     
-    if len(valid_countries) < 3:
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        pca_mode = st.radio("分析方法", ["年ごとにPCA（符号を最新年に合わせる）", "全年プール（共通の軸）"],
+                            key='pca_mode')
+    with col3:
+        imputation_label = st.selectbox("欠損値の扱い", list(IMPUTATION_METHODS.keys()), key='pca_imputation')
+    pooled = pca_mode == "全年プール（共通の軸）"
+    results = fit_pca_by_year(df, selected_countries, indicators_eng, pooled=pooled,
+                              imputation=IMPUTATION_METHODS[imputation_label])
+    
+    if not results:
         st.warning("十分なデータがある国が不足しています")
         return
     
-    data_matrix = np.array(data_matrix)
-    scaler = StandardScaler()
-    data_scaled = scaler.fit_transform(data_matrix)
-    
-    pca = PCA(n_components=2)
-    country_scores = pca.fit_transform(data_scaled)
-    
-    indicator_loadings = pca.components_.T * np.sqrt(pca.explained_variance_)
-    
-    fig = go.Figure()
-    
-    fig.add_trace(go.Scatter(x=country_scores[:, 0], y=country_scores[:, 1],
-                            mode='markers+text', text=valid_countries,
-                            textposition="top center", name='国',
-                            marker=dict(size=12, color='blue')))
-    
-    fig.add_trace(go.Scatter(x=indicator_loadings[:, 0], y=indicator_loadings[:, 1],
-                            mode='markers+text', text=selected_indicators_jp,
-                            textposition="top center", name='指標',
-                            marker=dict(size=10, color='red', symbol='diamond')))
+    result_years = sorted(results)
+    with col2:
+        year = st.select_slider("表示年を選択", options=result_years, value=result_years[-1], key='pca_year')
     
-    fig.add_hline(y=0, line_dash="dash", line_color="gray")
-    fig.add_vline(x=0, line_dash="dash", line_color="gray")
+    result = results[year]
+    if result['imputed_countries']:
+        st.info(f"欠損値補完（{imputation_label}）により{len(result['imputed_countries'])}カ国"
+                f"（{result['imputed_cells']}セル）を分析に追加しました: {', '.join(result['imputed_countries'])}")
+    explained = result['explained']
     
-    fig.update_layout(title="主成分分析結果（PCA: 2024年）",
-                     xaxis_title=f"第1主成分 ({pca.explained_variance_ratio_[0]*100:.1f}%)",
-                     yaxis_title=f"第2主成分 ({pca.explained_variance_ratio_[1]*100:.1f}%)",
-                     showlegend=True, height=600)
+    fig = pca_biplot_figure(result, selected_indicators_jp, year)
+    plotly_chart(fig, use_container_width=True)
     
-    st.plotly_chart(fig, use_container_width=True)
+    if len(result_years) > 1:
+        with st.expander("🎞️ 国の軌跡アニメーション（全調査年）"):
+            trajectory = pd.concat([
+                pd.DataFrame({'年': y, '国': results[y]['countries'],
+                              '第1主成分': results[y]['scores'][:, 0], '第2主成分': results[y]['scores'][:, 1]})
+                for y in result_years
+            ], ignore_index=True)
+            x_range = [trajectory['第1主成分'].min() - 0.5, trajectory['第1主成分'].max() + 0.5]
+            y_range = [trajectory['第2主成分'].min() - 0.5, trajectory['第2主成分'].max() + 0.5]
+            fig_anim = px.scatter(trajectory, x='第1主成分', y='第2主成分', text='国', animation_frame='年',
+                                  animation_group='国', range_x=x_range, range_y=y_range, height=600,
+                                  title=f"国の位置の推移（{pca_mode}）")
+            fig_anim.update_traces(textposition="top center", marker=dict(size=12))
+            plotly_chart(fig_anim, use_container_width=True)
     
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("📊 第1主成分の負荷量")
-        loadings_pc1 = pd.DataFrame({
-            '指標': selected_indicators_jp,
-            '負荷量': indicator_loadings[:, 0]
-        }).sort_values('負荷量', key=lambda x: x.abs(), ascending=False)
-        st.dataframe(loadings_pc1, use_container_width=True, hide_index=True)
+        st.dataframe(pca_loadings_table(result, selected_indicators_jp, 0), use_container_width=True,
+                     hide_index=True)
     
     with col2:
         st.subheader("📊 第2主成分の負荷量")
-        loadings_pc2 = pd.DataFrame({
-            '指標': selected_indicators_jp,
-            '負荷量': indicator_loadings[:, 1]
-        }).sort_values('負荷量', key=lambda x: x.abs(), ascending=False)
-        st.dataframe(loadings_pc2, use_container_width=True, hide_index=True)
+        st.dataframe(pca_loadings_table(result, selected_indicators_jp, 1), use_container_width=True,
+                     hide_index=True)
     
     with st.expander("📈 分析結果の解釈"):
         st.markdown(f"""
-        **累積寄与率:** {(pca.explained_variance_ratio_[0] + pca.explained_variance_ratio_[1])*100:.1f}%
+        **累積寄与率:** {(explained[0] + explained[1])*100:.1f}%
         
         **主成分負荷量の見方:**
         - 負荷量が大きい（絶対値が大きい）指標ほど、その主成分への寄与が大きい
@@ -598,6 +1940,592 @@ def correspondence_analysis(df):
         - 原点から離れている国ほど特徴的なパターンを持っています
         """)
 
+ML_MODEL_TYPES = ["線形回帰", "ランダムフォレスト", "勾配ブースティング"]
+ML_DEFAULT_FEATURES = [
+    'Bank or similar financial institution account (%, age 15+)',
+    'Mobile money account (%, age 15+)',
+    'Saved any money (%, age 15+)',
+    'Made a digital payment (%, age 15+)',
+    'Borrowed from a formal bank or similar financial institution (%, age 15+)'
+]
+
+def _make_regressor(model_type, n_jobs=None):
+    from sklearn.linear_model import LinearRegression
+    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+    
+    if model_type == "線形回帰":
+        return LinearRegression()
+    if model_type == "ランダムフォレスト":
+        return RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=n_jobs)
+    return GradientBoostingRegressor(n_estimators=100, random_state=42)
+
+def _cv_fold_scores(model_type, X, y, train_idx, test_idx):
+    from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+    
+    model = _make_regressor(model_type)
+    model.fit(X[train_idx], y[train_idx])
+    pred = model.predict(X[test_idx])
+    return model_type, r2_score(y[test_idx], pred), mean_squared_error(y[test_idx], pred), mean_absolute_error(y[test_idx], pred)
+
+def compare_models_cv(X, y, n_splits=5, n_repeats=3, random_state=42, n_jobs=-1):
+    """全モデルを反復K分割交差検証でプロセス並列に評価し、R²・MSE・MAEの平均と標準偏差を返す"""
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import RepeatedKFold
+    
+    n_splits = max(2, min(n_splits, len(y) // 2))
+    folds = list(RepeatedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state).split(X))
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(_cv_fold_scores)(model_type, X, y, train_idx, test_idx)
+        for model_type in ML_MODEL_TYPES for train_idx, test_idx in folds
+    )
+    scores = pd.DataFrame(scores, columns=['モデル', 'R²', 'MSE', 'MAE'])
+    return scores.groupby('モデル', sort=False).agg(['mean', 'std'])
+
+def _bootstrap_chunk(model_type, X, y, seeds):
+    n = len(y)
+    estimates = np.empty((len(seeds), X.shape[1]))
+    for b, seed in enumerate(seeds):
+        idx = np.random.default_rng(seed).integers(0, n, n)
+        if model_type == "線形回帰":
+            design = np.column_stack([np.ones(n), X[idx]])
+            estimates[b] = np.linalg.lstsq(design, y[idx], rcond=None)[0][1:]
+        else:
+            estimates[b] = _make_regressor(model_type).fit(X[idx], y[idx]).feature_importances_
+    return estimates
+
+def bootstrap_estimates(X, y, model_type, n_bootstrap=200, random_state=42, n_jobs=-1, level=0.95):
+    """ブートストラップ標本でモデルを再学習し、回帰係数（線形回帰）または特徴量重要度のパーセンタイル区間を返す
+    
+    各標本のシードはrandom_stateから導出するため、並列数やチャンク分割によらず結果は同じになる。
+    戻り値は (下限, 上限, 全標本の推定値)。
+    """
+    from joblib import Parallel, delayed
+    
+    seeds = np.random.SeedSequence(random_state).generate_state(n_bootstrap)
+    n_workers = _bootstrap_workers(model_type, n_jobs)
+    chunks = np.array_split(seeds, min(n_bootstrap, n_workers * 4))
+    if n_workers == 1:
+        parts = [_bootstrap_chunk(model_type, X, y, chunk) for chunk in chunks]
+    else:
+        parts = Parallel(n_jobs=n_workers)(delayed(_bootstrap_chunk)(model_type, X, y, chunk) for chunk in chunks)
+    estimates = np.vstack(parts)
+    alpha = (1 - level) / 2 * 100
+    lower, upper = np.percentile(estimates, [alpha, 100 - alpha], axis=0)
+    return lower, upper, estimates
+
+# 1CPUで再学習1回にかかるおおよその秒数（中所得国110カ国・説明変数10個で計測）
+BOOTSTRAP_FIT_SECONDS = {"線形回帰": 0.001, "ランダムフォレスト": 0.3, "勾配ブースティング": 0.1}
+BOOTSTRAP_MAX_SECONDS = 30
+BOOTSTRAP_STEP = 50
+
+def _bootstrap_workers(model_type, n_jobs=-1):
+    from joblib import effective_n_jobs
+    
+    return 1 if model_type == "線形回帰" else effective_n_jobs(n_jobs)
+
+def bootstrap_limits(model_type, n_jobs=-1):
+    """モデルの学習コストと並列数から、ブートストラップ回数の上限と既定値を決める
+    
+    上限は見積もり所要時間がBOOTSTRAP_MAX_SECONDS秒に収まる回数（BOOTSTRAP_STEP刻み、1000回まで）。
+    """
+    affordable = BOOTSTRAP_MAX_SECONDS * _bootstrap_workers(model_type, n_jobs) / BOOTSTRAP_FIT_SECONDS[model_type]
+    maximum = int(min(1000, max(2 * BOOTSTRAP_STEP, affordable // BOOTSTRAP_STEP * BOOTSTRAP_STEP)))
+    return maximum, min(200, maximum)
+
+def bootstrap_seconds(model_type, n_bootstrap, n_jobs=-1):
+    """ブートストラップの見積もり所要時間（秒）"""
+    return n_bootstrap * BOOTSTRAP_FIT_SECONDS[model_type] / _bootstrap_workers(model_type, n_jobs)
+
+FEATURE_SEARCH_METHODS = {'前向き選択（1つずつ追加）': 'forward', 'LASSOパス（投入順）': 'lasso'}
+FEATURE_SEARCH_MIN_COVERAGE = 0.9
+
+def _cv_subset_scores(model_type, X, y, subsets, folds, deadline=None, min_subsets=0):
+    """候補ごとの交差検証R²（平均, 標準偏差）
+    
+    deadline（time.time()の時刻）を過ぎたら、評価中の候補も含めて残りは評価しない（先頭のmin_subsets個は除く）。
+    """
+    from sklearn.metrics import r2_score
+    
+    scores = []
+    for subset in subsets:
+        fold_scores = []
+        for train_idx, test_idx in folds:
+            if deadline is not None and len(scores) >= min_subsets and time.time() > deadline:
+                return scores
+            model = _make_regressor(model_type)
+            model.fit(X[np.ix_(train_idx, subset)], y[train_idx])
+            fold_scores.append(r2_score(y[test_idx], model.predict(X[np.ix_(test_idx, subset)])))
+        scores.append((np.mean(fold_scores), np.std(fold_scores)))
+    return scores
+
+def _evaluate_subsets(parallel, n_workers, model_type, X, y, subsets, folds, deadline):
+    """候補をチャンクに分けてプロセスプールで評価する
+    
+    各ワーカーは候補を1つ評価するごとに期限を確かめ、過ぎていればチャンクの残りを飛ばす
+    （少なくとも先頭の候補1つは評価する）。戻り値は (評価できた候補, そのスコア, 全候補を評価したか)。
+    """
+    from joblib import delayed
+    
+    chunk_size = max(1, -(-len(subsets) // (n_workers * 4)))
+    chunks = [subsets[i:i + chunk_size] for i in range(0, len(subsets), chunk_size)]
+    parts = parallel(delayed(_cv_subset_scores)(model_type, X, y, chunk, folds, deadline, int(k == 0))
+                     for k, chunk in enumerate(chunks))
+    evaluated, scores = [], []
+    for chunk, part in zip(chunks, parts):
+        evaluated.extend(chunk[:len(part)])
+        scores.extend(part)
+    return evaluated, scores, len(scores) == len(subsets)
+
+def search_feature_subsets(X, y, feature_names, model_type="線形回帰", method='forward', max_features=5,
+                           n_splits=5, time_budget=30.0, patience=1, min_improvement=0.0, n_jobs=-1,
+                           random_state=42):
+    """交差検証R²で説明変数の組み合わせを探索し、特徴量数ごとの最良の組み合わせを返す
+    
+    method='forward'は前向き選択、method='lasso'はLASSOパスに入った順に特徴量を加える。
+    候補の評価はjoblibのプロセスプールで並列に行い、time_budget秒を超えるか、
+    R²がpatience回続けて改善しなければ打ち切る。戻り値は (結果の表, 打ち切り理由)。
+    """
+    from joblib import Parallel, effective_n_jobs
+    from sklearn.model_selection import KFold
+    
+    # ワーカープロセスでも比べられるよう、期限は壁時計の時刻で持つ
+    deadline = time.time() + time_budget
+    n_splits = max(2, min(n_splits, len(y) // 2))
+    folds = list(KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X))
+    max_features = min(max_features, X.shape[1])
+    n_workers = effective_n_jobs(n_jobs)
+    rows = []
+    stop_reason = "最大特徴量数に到達"
+    best, stale = -np.inf, 0
+    
+    def accept(subset, mean, std):
+        nonlocal best, stale
+        rows.append((len(subset), [feature_names[j] for j in subset], mean, std))
+        if mean <= best + min_improvement:
+            stale += 1
+        else:
+            best, stale = mean, 0
+        return stale >= patience
+    
+    with Parallel(n_jobs=n_jobs) as parallel:
+        if method == 'forward':
+            selected = []
+            for _ in range(max_features):
+                candidates = [selected + [j] for j in range(X.shape[1]) if j not in selected]
+                evaluated, scores, finished = _evaluate_subsets(parallel, n_workers, model_type, X, y,
+                                                                candidates, folds, deadline)
+                i = int(np.argmax([mean for mean, _ in scores]))
+                selected = evaluated[i]
+                if accept(selected, *scores[i]):
+                    stop_reason = "R²の改善が止まったため早期終了"
+                    break
+                if not finished or time.time() > deadline:
+                    stop_reason = "時間上限に到達"
+                    break
+        elif method == 'lasso':
+            from sklearn.linear_model import lasso_path
+            
+            Xs = (X - X.mean(axis=0)) / np.where(X.std(axis=0) > 0, X.std(axis=0), 1)
+            _, coefs, _ = lasso_path(Xs, y - y.mean(), n_alphas=200)
+            active = coefs != 0
+            entered = np.where(active.any(axis=1), active.argmax(axis=1), active.shape[1])
+            order = [j for j in np.argsort(entered, kind='stable') if active[j].any()][:max_features]
+            subsets = [order[:k] for k in range(1, len(order) + 1)]
+            evaluated, scores, finished = _evaluate_subsets(parallel, n_workers, model_type, X, y, subsets, folds,
+                                                            deadline)
+            for subset, (mean, std) in sorted(zip(evaluated, scores), key=lambda pair: len(pair[0])):
+                if accept(subset, mean, std):
+                    stop_reason = "R²の改善が止まったため早期終了"
+                    break
+            else:
+                if not finished:
+                    stop_reason = "時間上限に到達"
+        else:
+            raise ValueError(f"未対応の探索方法です: {method}")
+    
+    table = pd.DataFrame(rows, columns=['特徴量数', '指標', 'R²（平均）', 'R²（標準偏差）'])
+    return table, stop_reason
+
+def ml_result_key(target_variable, feature_variables, region_scope, model_type, dataset_version, imputation=None,
+                  n_bootstrap=0, target_version=None):
+    """設定とデータセットのバージョン（世銀の目的変数は取得時刻も）から内容アドレス型のキーを作る
+    
+    バージョンのないDataFrameではNoneを返し、結果はキャッシュしない。
+    """
+    if dataset_version is None:
+        return None
+    payload = json.dumps([target_variable, sorted(feature_variables), region_scope, model_type, dataset_version,
+                          imputation, n_bootstrap, target_version], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def ml_target_version(target_type, target_indicator, region_scope):
+    """目的変数のデータの版（世界銀行データは取得時刻、Findexの指標はデータセットのバージョンに含まれるのでNone）"""
+    if target_type != 'wb':
+        return None
+    return world_bank_data_version(WB_INDICATORS[target_indicator], 2024, ML_COUNTRY_GROUPS[region_scope])
+
+class MLResultCache:
+    """分析結果のLRUキャッシュ（disk_dirを指定すると、容量上限とTTL付きのディスク層も使う）
+    
+    描画に使わない学習済みモデル（'model'）は保存しない。ディスク層は更新時刻を最終利用時刻として扱い、
+    ttlを過ぎたものと、合計がmax_bytesを超えた分の古いものから削除する。
+    """
+
+    def __init__(self, maxsize=32, disk_dir=None, max_bytes=200 * 1024 ** 2, ttl=30 * 24 * 3600):
+        self.maxsize = maxsize
+        self.disk_dir = disk_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _insert(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key):
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(path)
+            return result
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def _disk_prune(self):
+        entries = []
+        with os.scandir(self.disk_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.pkl'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort(reverse=True)
+        total = 0
+        now = time.time()
+        for mtime, size, path in entries:
+            total += size
+            if total > self.max_bytes or now - mtime > self.ttl:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        result = self._disk_get(key) if self.disk_dir else None
+        with self._lock:
+            if result is not None:
+                self._insert(key, result)
+                self.hits += 1
+            else:
+                self.misses += 1
+        return result
+
+    def put(self, key, result):
+        if key is None:
+            return
+        result = {k: v for k, v in result.items() if k != 'model'}
+        with self._lock:
+            self._insert(key, result)
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                tmp_path = _tmp_path(self._disk_path(key))
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self._disk_path(key))
+                self._disk_prune()
+            except (OSError, pickle.PicklingError) as e:
+                warnings.warn(f"分析結果をディスクに保存できませんでした: {e}")
+
+ML_RESULT_CACHE_SIZE = 32
+# ディスク層は複数ワーカー間で結果を共有したい場合だけ FINDEX_ML_DISK_CACHE=1 で有効にする
+ML_RESULT_DISK_DIR = (os.path.join(FINDEX_CACHE_DIR, 'models')
+                      if os.environ.get('FINDEX_ML_DISK_CACHE', '') == '1' else None)
+ML_RESULT_DISK_MAX_BYTES = int(os.environ.get('FINDEX_ML_DISK_CACHE_MB', '200')) * 1024 ** 2
+ML_RESULT_DISK_TTL = 30 * 24 * 3600
+
+@st.cache_resource(show_spinner=False)
+def get_ml_result_cache():
+    return MLResultCache(ML_RESULT_CACHE_SIZE, ML_RESULT_DISK_DIR, ML_RESULT_DISK_MAX_BYTES, ML_RESULT_DISK_TTL)
+
+def prepare_ml_dataset(df, target_type, target_indicator, feature_variables, target_countries_eng, imputation=None):
+    """説明変数と目的変数を国単位で結合したデータを返す（世界銀行データが取得できなければNone）
+    
+    imputationを指定すると説明変数の欠損だけを補完し、補完した国には'補完'列がTrueになる。
+    """
+    countries_eng = [c for c in target_countries_eng if c in COUNTRY_MAP]
+    countries_jp = [COUNTRY_MAP[c] for c in countries_eng]
+    columns = feature_variables + ([target_indicator] if target_type == 'findex' else [])
+    matrix, missing = build_feature_matrix(df, countries_jp, columns, 'all', 2024)
+    features, imputed = impute_matrix(matrix[:, :len(feature_variables)], imputation)
+    
+    feature_df = pd.DataFrame(features, columns=feature_variables)
+    feature_df.insert(0, '国_英', countries_eng)
+    feature_df.insert(1, '国_日', countries_jp)
+    feature_df['補完'] = imputed.any(axis=1)
+    if target_type == 'findex':
+        feature_df['target_value'] = matrix[:, -1]
+    feature_df = feature_df[~missing[:, :len(feature_variables)].all(axis=1)]
+    
+    if target_type == 'findex':
+        return feature_df.dropna()
+    
+    indicator_code = WB_INDICATORS[target_indicator]
+    wb_data = get_world_bank_data(indicator_code, 2024, target_countries_eng,
+                                  world_bank_data_version(indicator_code, 2024, target_countries_eng))
+    if wb_data.empty:
+        return None
+    
+    wb_data['country_name'] = wb_data['country'].apply(lambda x: x.get('value') if isinstance(x, dict) else None)
+    wb_data['target_value'] = wb_data['value']
+    wb_data = wb_data[['country_name', 'target_value']].dropna()
+    wb_data = wb_data[wb_data['country_name'].isin(target_countries_eng)]
+    
+    merged_data = pd.merge(wb_data, feature_df, left_on='country_name', right_on='国_英', how='inner')
+    return merged_data.dropna()
+
+def fit_ml_model(X, y, feature_variables, model_type, n_bootstrap=0):
+    """選択したモデルを学習し、表示用の指標・係数・重要度をまとめて返す
+    
+    n_bootstrapが正のときは係数・重要度に95%ブートストラップ区間（'下限'・'上限'列）を付ける。
+    """
+    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+    from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+    from sklearn.model_selection import train_test_split
+    import statsmodels.api as sm
+    
+    if model_type == "全モデル比較（交差検証）":
+        return {'cv_summary': compare_models_cv(X, y), 'n_splits': max(2, min(5, len(y) // 2))}
+    
+    if model_type == "線形回帰":
+        X_with_const = sm.add_constant(X)
+        lr_model = sm.OLS(y, X_with_const).fit()
+        lr_pred = lr_model.predict(X_with_const)
+        coef_df = pd.DataFrame({
+            '指標': feature_variables,
+            '回帰係数': lr_model.params[1:],
+            'P値': lr_model.pvalues[1:]
+        })
+        if n_bootstrap:
+            coef_df['下限'], coef_df['上限'], _ = bootstrap_estimates(X, y, model_type, n_bootstrap)
+        metrics = [("決定係数 (R²)", f"{lr_model.rsquared:.3f}"),
+                   ("平均二乗誤差", f"{mean_squared_error(y, lr_pred):.2f}"),
+                   ("平均絶対誤差", f"{mean_absolute_error(y, lr_pred):.2f}")]
+        lr_model.remove_data()
+        return {'model': lr_model, 'metrics': metrics, 'coef_df': coef_df}
+    
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    if model_type == "ランダムフォレスト":
+        model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+        importance_title = "特徴量重要度ランキング"
+    else:
+        model = GradientBoostingRegressor(n_estimators=100, random_state=42)
+        importance_title = "特徴量重要度ランキング（勾配ブースティング）"
+    model.fit(X_train, y_train)
+    pred_test = model.predict(X_test)
+    metrics = [("Train Score", f"{model.score(X_train, y_train):.3f}"),
+               ("Test Score", f"{model.score(X_test, y_test):.3f}"),
+               ("Test R²", f"{r2_score(y_test, pred_test):.3f}"),
+               ("Test MSE", f"{mean_squared_error(y_test, pred_test):.2f}")]
+    importance_df = pd.DataFrame({
+        '指標': feature_variables,
+        '重要度': model.feature_importances_
+    })
+    if n_bootstrap:
+        importance_df['下限'], importance_df['上限'], _ = bootstrap_estimates(X, y, model_type, n_bootstrap)
+    importance_df = importance_df.sort_values('重要度', ascending=False)
+    return {'model': model, 'metrics': metrics, 'importance_df': importance_df, 'importance_title': importance_title}
+
+def run_ml_analysis(df, target_type, target_indicator, feature_variables, region_scope, model_type, imputation=None,
+                    n_bootstrap=0):
+    """データ準備からモデル学習までを行い、描画に必要な結果をdictで返す
+    
+    'target_version'は取得後の目的変数の版（結果はこの版を含むキーで保存する）。
+    """
+    with perf_stage('ml_prepare'):
+        merged_data = prepare_ml_dataset(df, target_type, target_indicator, feature_variables,
+                                         ML_COUNTRY_GROUPS[region_scope], imputation)
+    if merged_data is None:
+        return {'status': 'wb_error'}
+    
+    result = {'status': 'ok', 'region_scope': region_scope, 'n': len(merged_data),
+              'target_version': ml_target_version(target_type, target_indicator, region_scope),
+              'countries': list(merged_data['国_日'].unique()),
+              'imputed_countries': list(merged_data.loc[merged_data['補完'], '国_日'].unique())}
+    if len(merged_data) < 5:
+        result['status'] = 'insufficient'
+        return result
+    
+    X = merged_data[feature_variables].values
+    y = merged_data['target_value'].values
+    with perf_stage('ml_fit'):
+        result.update(fit_ml_model(X, y, feature_variables, model_type, n_bootstrap))
+    result['n_bootstrap'] = n_bootstrap
+    return result
+
+def run_feature_search(df, target_type, target_indicator, region_scope, model_type, method, max_features,
+                       time_budget, imputation=None):
+    """全Findex指標を候補に説明変数の組み合わせを自動探索し、描画に必要な結果をdictで返す
+    
+    対象国の9割以上で観測されている指標だけを候補にし、残りの欠損は補完してから評価する。
+    'target_version'はrun_ml_analysisと同じく取得後の目的変数の版。
+    """
+    countries_eng = [c for c in ML_COUNTRY_GROUPS[region_scope] if c in COUNTRY_MAP]
+    candidates = [i for i in get_all_indicators(df) if i != target_indicator]
+    _, missing = build_feature_matrix(df, [COUNTRY_MAP[c] for c in countries_eng], candidates, 'all', 2024)
+    coverage = 1 - missing.mean(axis=0) if len(countries_eng) else np.zeros(len(candidates))
+    candidates = [c for c, ok in zip(candidates, coverage >= FEATURE_SEARCH_MIN_COVERAGE) if ok]
+    
+    result = {'status': 'ok', 'region_scope': region_scope, 'n': 0, 'n_candidates': len(candidates)}
+    if not candidates:
+        result['status'] = 'insufficient'
+        return result
+    
+    merged_data = prepare_ml_dataset(df, target_type, target_indicator, candidates, countries_eng,
+                                     imputation or 'median')
+    if merged_data is None:
+        return {'status': 'wb_error'}
+    result['n'] = len(merged_data)
+    result['target_version'] = ml_target_version(target_type, target_indicator, region_scope)
+    if len(merged_data) < 10:
+        result['status'] = 'insufficient'
+        return result
+    
+    start = time.perf_counter()
+    result['table'], result['stop_reason'] = search_feature_subsets(
+        merged_data[candidates].values, merged_data['target_value'].values, candidates,
+        model_type=model_type, method=method, max_features=max_features, time_budget=time_budget)
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+def _apply_searched_features(features):
+    st.session_state['ml_features'] = list(features)
+
+def render_feature_search(result):
+    if result['status'] == 'wb_error':
+        st.error("世界銀行APIからデータを取得できませんでした")
+        return
+    if result['status'] == 'insufficient':
+        st.warning(f"⚠️ 探索に十分なデータがありません（候補指標{result['n_candidates']}個・{result['n']}カ国）")
+        return
+    
+    table = result['table']
+    st.success(f"✓ {result['region_scope']}の{result['n']}カ国・候補指標{result['n_candidates']}個を"
+               f"{result['elapsed']:.1f}秒で探索しました（{result['stop_reason']}）")
+    
+    fig = go.Figure(go.Scatter(x=table['特徴量数'], y=table['R²（平均）'], mode='lines+markers',
+                               error_y=dict(type='data', array=table['R²（標準偏差）'])))
+    fig.update_layout(title="特徴量数ごとの交差検証R²（平均 ± 標準偏差）", xaxis_title="特徴量数",
+                      yaxis_title="R²", xaxis=dict(dtick=1))
+    plotly_chart(fig, use_container_width=True)
+    
+    display_df = table.assign(指標=table['指標'].map(' / '.join))
+    st.dataframe(display_df.round(3), use_container_width=True, hide_index=True)
+    
+    best_k = int(table.loc[table['R²（平均）'].idxmax(), '特徴量数'])
+    k = st.selectbox("説明変数に設定する組み合わせ（特徴量数）", table['特徴量数'].tolist(),
+                     index=table['特徴量数'].tolist().index(best_k), key='search_apply_k')
+    st.button("✅ この組み合わせを説明変数に設定", on_click=_apply_searched_features,
+              args=(table.loc[table['特徴量数'] == k, '指標'].iloc[0],))
+
+def _bootstrap_error_bars(table, value_column):
+    if '下限' not in table:
+        return None
+    return dict(type='data', array=table['上限'] - table[value_column],
+                arrayminus=table[value_column] - table['下限'])
+
+def ml_result_figure(result):
+    """run_ml_analysisの結果から、交差検証R²・回帰係数・特徴量重要度のいずれかのグラフを作る"""
+    if 'cv_summary' in result:
+        cv_summary = result['cv_summary']
+        fig = go.Figure(go.Bar(x=cv_summary.index, y=cv_summary[('R²', 'mean')],
+                               error_y=dict(type='data', array=cv_summary[('R²', 'std')])))
+        fig.update_layout(title="交差検証R²（平均 ± 標準偏差）", xaxis_title="モデル", yaxis_title="R²")
+        return fig
+    
+    table = result.get('coef_df', result.get('importance_df'))
+    suffix = ''
+    if '下限' in table:
+        suffix = f"（エラーバー: {result['n_bootstrap']}回のブートストラップによる95%区間）"
+    
+    if 'coef_df' in result:
+        fig = go.Figure()
+        colors = ['red' if c < 0 else 'blue' for c in table['回帰係数']]
+        fig.add_trace(go.Bar(x=table['回帰係数'], y=table['指標'], 
+                             orientation='h', marker_color=colors, error_x=_bootstrap_error_bars(table, '回帰係数')))
+        fig.update_layout(title="各指標の回帰係数" + suffix, xaxis_title="回帰係数", yaxis_title="指標")
+        return fig
+    
+    fig = px.bar(table, x='重要度', y='指標', orientation='h', title=result['importance_title'] + suffix)
+    fig.update_traces(error_x=_bootstrap_error_bars(table, '重要度'))
+    return fig
+
+def ml_cv_summary_table(cv_summary):
+    summary_df = pd.DataFrame({'モデル': cv_summary.index})
+    for metric in ['R²', 'MSE', 'MAE']:
+        summary_df[metric] = [f"{m:.3f} ± {sd:.3f}" for m, sd in
+                              zip(cv_summary[(metric, 'mean')], cv_summary[(metric, 'std')])]
+    return summary_df
+
+def render_ml_result(result):
+    if result['status'] == 'wb_error':
+        st.error("世界銀行APIからデータを取得できませんでした")
+        return
+    
+    if result['n'] > 0:
+        st.success(f"✓ {result['region_scope']}の{result['n']}カ国のデータで分析を実行します")
+        st.info(f"分析対象国: {', '.join(result['countries'])}")
+    if result.get('imputed_countries'):
+        st.info(f"欠損値補完により{len(result['imputed_countries'])}カ国を分析に追加しました: "
+                f"{', '.join(result['imputed_countries'])}")
+    
+    if result['status'] == 'insufficient':
+        st.warning(f"⚠️ 分析に十分なデータがありません（{result['n']}カ国のみ）")
+        st.info("ヒント: データが揃っている指標を選択するか、異なる目的変数を試してください。")
+        return
+    
+    st.success("分析完了！")
+    
+    if 'cv_summary' in result:
+        st.subheader(f"📈 モデル比較（{result['n_splits']}分割 × 3回の交差検証）")
+        st.dataframe(ml_cv_summary_table(result['cv_summary']), use_container_width=True, hide_index=True)
+        plotly_chart(ml_result_figure(result), use_container_width=True)
+        return
+    
+    st.subheader("📈 モデル性能")
+    cols = st.columns(len(result['metrics']))
+    for col, (label, value) in zip(cols, result['metrics']):
+        with col:
+            st.metric(label, value)
+    
+    if 'coef_df' in result:
+        st.subheader("📊 回帰係数")
+        plotly_chart(ml_result_figure(result), use_container_width=True)
+        
+        st.subheader("📋 回帰係数とP値")
+        st.dataframe(result['coef_df'], use_container_width=True, hide_index=True)
+    else:
+        st.subheader("📊 特徴量重要度")
+        plotly_chart(ml_result_figure(result), use_container_width=True)
+
 def machine_learning_analysis(df):
     st.header("🤖 機械学習による回帰分析（2024年データ）")
     
@@ -605,14 +2533,7 @@ def machine_learning_analysis(df):
     
     all_indicators = get_all_indicators(df)
     
-    default_features_eng = [
-        'Bank or similar financial institution account (%, age 15+)',
-        'Mobile money account (%, age 15+)',
-        'Saved any money (%, age 15+)',
-        'Made a digital payment (%, age 15+)',
-        'Borrowed from a formal bank or similar financial institution (%, age 15+)'
-    ]
-    default_features = [f for f in default_features_eng if f in all_indicators][:5]
+    default_features = [f for f in ML_DEFAULT_FEATURES if f in all_indicators][:5]
     
     target_options = {}
     for wb_name in WB_INDICATORS.keys():
@@ -628,196 +2549,253 @@ def machine_learning_analysis(df):
     
     with col2:
         st.subheader("📊 説明変数選択")
-        feature_variables = st.multiselect("説明変数（Findex指標）を選択", all_indicators,
-                                          default=default_features)
+        st.session_state.setdefault('ml_features', default_features)
+        feature_variables = st.multiselect("説明変数（Findex指標）を選択", all_indicators, key='ml_features')
     
     region_scope = st.selectbox("分析対象地域", list(ML_COUNTRY_GROUPS.keys()))
-    model_type = st.selectbox("使用するモデル", ["線形回帰", "ランダムフォレスト", "勾配ブースティング"])
+    model_type = st.selectbox("使用するモデル", ML_MODEL_TYPES + ["全モデル比較（交差検証）"])
+    imputation_label = st.selectbox("説明変数の欠損値の扱い", list(IMPUTATION_METHODS.keys()), key='ml_imputation')
+    imputation = IMPUTATION_METHODS[imputation_label]
+    n_bootstrap = 0
+    if model_type in ML_MODEL_TYPES and st.checkbox("ブートストラップで95%信頼区間を表示", key='ml_bootstrap'):
+        max_bootstrap, default_bootstrap = bootstrap_limits(model_type)
+        n_bootstrap = st.slider("ブートストラップ回数", BOOTSTRAP_STEP, max_bootstrap, default_bootstrap,
+                                step=BOOTSTRAP_STEP, key=f'ml_bootstrap_n_{max_bootstrap}')
+        st.caption(f"見積もり所要時間: 約{bootstrap_seconds(model_type, n_bootstrap):.0f}秒"
+                   f"（{model_type}は最大{max_bootstrap}回）")
+    
+    cache = get_ml_result_cache()
+    target_version = ml_target_version(*target_options[target_variable_display], region_scope)
+    cache_key = ml_result_key(target_variable_display, feature_variables, region_scope, model_type,
+                              df.attrs.get('dataset_version'), imputation, n_bootstrap, target_version)
+    
+    with st.expander("🔎 説明変数の自動探索（交差検証）"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            search_label = st.radio("探索方法", list(FEATURE_SEARCH_METHODS.keys()), key='search_method')
+        with col2:
+            max_features = st.slider("最大特徴量数", 1, 10, 5, key='search_max_features')
+        with col3:
+            time_budget = st.slider("時間上限（秒）", 5, 120, 30, key='search_time_budget')
+        search_model = model_type if model_type in ML_MODEL_TYPES else "線形回帰"
+        st.caption(f"全Findex指標から、{search_model}の交差検証R²が高くなる組み合わせを探します。"
+                   "欠損値は補完してから評価します（「なし」の場合は中央値で補完）。")
+        search_key = ml_result_key(target_variable_display, [], region_scope,
+                                   f"特徴量探索:{search_label}:{search_model}:{max_features}:{time_budget}",
+                                   df.attrs.get('dataset_version'), imputation, target_version=target_version)
+        if st.button("🔎 探索実行"):
+            search_result = cache.get(search_key)
+            if search_result is None:
+                target_type, target_indicator = target_options[target_variable_display]
+                with st.spinner("説明変数の組み合わせを探索中..."):
+                    search_result = run_feature_search(df, target_type, target_indicator, region_scope, search_model,
+                                                       FEATURE_SEARCH_METHODS[search_label], max_features,
+                                                       time_budget, imputation)
+                if search_result['status'] != 'wb_error':
+                    # 世銀データをここで初めて取得した場合は版が変わるので、取得後の版のキーで保存する
+                    search_key = ml_result_key(target_variable_display, [], region_scope,
+                                               f"特徴量探索:{search_label}:{search_model}:{max_features}:{time_budget}",
+                                               df.attrs.get('dataset_version'), imputation,
+                                               target_version=search_result.get('target_version', target_version))
+                    cache.put(search_key, search_result)
+            st.session_state.setdefault('ml_result_keys', set()).add(search_key)
+        elif search_key in st.session_state.get('ml_result_keys', set()):
+            search_result = cache.get(search_key)
+        else:
+            search_result = None
+        if search_result is not None:
+            render_feature_search(search_result)
     
     if st.button("🚀 分析実行"):
         if not feature_variables:
             st.warning("少なくとも1つの説明変数を選択してください")
             return
         
-        target_type, target_indicator = target_options[target_variable_display]
-        target_countries_eng = ML_COUNTRY_GROUPS[region_scope]
-        
-        feature_data_list = []
-        for country_eng in target_countries_eng:
-            if country_eng in COUNTRY_MAP:
-                country_jp = COUNTRY_MAP[country_eng]
-                row_data = {'国_英': country_eng, '国_日': country_jp}
-                
-                for feature_eng in feature_variables:
-                    data = get_data_for_indicator(df, feature_eng, 'all', 2024)
-                    country_data = data[data['国'] == country_jp]
-                    if not country_data.empty:
-                        row_data[feature_eng] = country_data['値'].values[0]
-                    else:
-                        row_data[feature_eng] = np.nan
-                
-                if target_type == 'findex':
-                    target_data = get_data_for_indicator(df, target_indicator, 'all', 2024)
-                    target_country_data = target_data[target_data['国'] == country_jp]
-                    if not target_country_data.empty:
-                        row_data['target_value'] = target_country_data['値'].values[0]
-                    else:
-                        row_data['target_value'] = np.nan
-                
-                if not all(np.isnan(row_data[f]) if isinstance(row_data.get(f), float) and np.isnan(row_data.get(f)) else False for f in feature_variables):
-                    feature_data_list.append(row_data)
-        
-        feature_df = pd.DataFrame(feature_data_list)
-        
-        if target_type == 'wb':
-            with st.spinner("世界銀行APIからデータを取得中..."):
-                wb_data = get_world_bank_data(WB_INDICATORS[target_indicator], 2024, target_countries_eng)
-                
-                if wb_data.empty:
-                    st.error("世界銀行APIからデータを取得できませんでした")
-                    return
-                
-                wb_data['country_name'] = wb_data['country'].apply(lambda x: x.get('value') if isinstance(x, dict) else None)
-                wb_data['target_value'] = wb_data['value']
-                wb_data = wb_data[['country_name', 'target_value']].dropna()
-                wb_data = wb_data[wb_data['country_name'].isin(target_countries_eng)]
-                
-                merged_data = pd.merge(wb_data, feature_df, left_on='country_name', right_on='国_英', how='inner')
-                merged_data = merged_data.dropna()
-        else:
-            merged_data = feature_df.dropna()
-        
-        if len(merged_data) > 0:
-            analyzed_countries = merged_data['国_日'].unique()
-            st.success(f"✓ {region_scope}の{len(merged_data)}カ国のデータで分析を実行します")
-            st.info(f"分析対象国: {', '.join(analyzed_countries)}")
-        
-        if len(merged_data) < 5:
-            st.warning(f"⚠️ 分析に十分なデータがありません（{len(merged_data)}カ国のみ）")
-            st.info("ヒント: データが揃っている指標を選択するか、異なる目的変数を試してください。")
-            return
-        
-        X = merged_data[feature_variables].values
-        y = merged_data['target_value'].values
-        
-        st.success("分析完了！")
-        
-        if model_type == "線形回帰":
-            X_with_const = sm.add_constant(X)
-            lr_model = sm.OLS(y, X_with_const).fit()
-            lr_pred = lr_model.predict(X_with_const)
-            lr_r2 = lr_model.rsquared
-            lr_mse = mean_squared_error(y, lr_pred)
-            lr_mae = mean_absolute_error(y, lr_pred)
-            
-            st.subheader("📈 モデル性能")
-            cols = st.columns(3)
-            with cols[0]:
-                st.metric("決定係数 (R²)", f"{lr_r2:.3f}")
-            with cols[1]:
-                st.metric("平均二乗誤差", f"{lr_mse:.2f}")
-            with cols[2]:
-                st.metric("平均絶対誤差", f"{lr_mae:.2f}")
-            
-            st.subheader("📊 回帰係数")
-            coef_df = pd.DataFrame({
-                '指標': feature_variables,
-                '回帰係数': lr_model.params[1:],
-                'P値': lr_model.pvalues[1:]
-            })
-            fig_coef = go.Figure()
-            colors = ['red' if c < 0 else 'blue' for c in coef_df['回帰係数']]
-            fig_coef.add_trace(go.Bar(x=coef_df['回帰係数'], y=coef_df['指標'], 
-                                     orientation='h', marker_color=colors))
-            fig_coef.update_layout(title="各指標の回帰係数", xaxis_title="回帰係数", yaxis_title="指標")
-            st.plotly_chart(fig_coef, use_container_width=True)
-            
-            st.subheader("📋 回帰係数とP値")
-            st.dataframe(coef_df, use_container_width=True, hide_index=True)
-            
-        elif model_type == "ランダムフォレスト":
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            rf_model = RandomForestRegressor(n_estimators=100, random_state=42)
-            rf_model.fit(X_train, y_train)
-            train_score = rf_model.score(X_train, y_train)
-            test_score = rf_model.score(X_test, y_test)
-            rf_pred_test = rf_model.predict(X_test)
-            rf_r2 = r2_score(y_test, rf_pred_test)
-            rf_mse = mean_squared_error(y_test, rf_pred_test)
-            
-            st.subheader("📈 モデル性能")
-            cols = st.columns(4)
-            with cols[0]:
-                st.metric("Train Score", f"{train_score:.3f}")
-            with cols[1]:
-                st.metric("Test Score", f"{test_score:.3f}")
-            with cols[2]:
-                st.metric("Test R²", f"{rf_r2:.3f}")
-            with cols[3]:
-                st.metric("Test MSE", f"{rf_mse:.2f}")
-            
-            st.subheader("📊 特徴量重要度")
-            importance_df = pd.DataFrame({
-                '指標': feature_variables,
-                '重要度': rf_model.feature_importances_
-            }).sort_values('重要度', ascending=False)
-            fig_imp = px.bar(importance_df, x='重要度', y='指標', orientation='h',
-                            title="特徴量重要度ランキング")
-            st.plotly_chart(fig_imp, use_container_width=True)
-            
+        result = cache.get(cache_key)
+        if result is None:
+            target_type, target_indicator = target_options[target_variable_display]
+            with st.spinner("データを準備してモデルを学習中..."):
+                result = run_ml_analysis(df, target_type, target_indicator, feature_variables, region_scope,
+                                         model_type, imputation, n_bootstrap)
+            if result['status'] != 'wb_error':
+                cache_key = ml_result_key(target_variable_display, feature_variables, region_scope, model_type,
+                                          df.attrs.get('dataset_version'), imputation, n_bootstrap,
+                                          result.get('target_version', target_version))
+                cache.put(cache_key, result)
+        st.session_state.setdefault('ml_result_keys', set()).add(cache_key)
+    elif cache_key in st.session_state.get('ml_result_keys', set()):
+        result = cache.get(cache_key)
+    else:
+        result = None
+    
+    if result is not None:
+        render_ml_result(result)
+
+WARMUP_ENABLED = os.environ.get('FINDEX_WARMUP', '1') != '0'
+WARMUP_PREFETCH_TIMEOUT = 120
+
+def _warm_ml_default(df, wb_name, prefetch):
+    """機械学習ページの既定設定（地域・モデル・説明変数）で世銀指標を目的変数にした結果を用意する
+    
+    世界銀行データは起動時の事前取得（prefetch）の完了を待ってそのキャッシュから読み、
+    事前取得で手に入らなかった指標は自分では取りに行かない。
+    """
+    prefetch['ready'].wait(WARMUP_PREFETCH_TIMEOUT)
+    region_scope = next(iter(ML_COUNTRY_GROUPS))
+    target_version = ml_target_version('wb', wb_name, region_scope)
+    if target_version is None:
+        return
+    features = [f for f in ML_DEFAULT_FEATURES if f in get_all_indicators(df)][:5]
+    model_type = ML_MODEL_TYPES[0]
+    key = ml_result_key(f"【世銀】{wb_name}", features, region_scope, model_type, df.attrs['dataset_version'],
+                        target_version=target_version)
+    cache = get_ml_result_cache()
+    if cache.get(key) is None:
+        result = run_ml_analysis(df, 'wb', wb_name, features, region_scope, model_type)
+        if result['status'] != 'wb_error':
+            cache.put(ml_result_key(f"【世銀】{wb_name}", features, region_scope, model_type,
+                                    df.attrs['dataset_version'], target_version=result['target_version']), result)
+
+def warmup_tasks(df, prefetch):
+    """起動直後に温めておく各ページの既定表示の計算を (ラベル, 関数) の並びで返す（prefetchは世銀データの事前取得の状態）"""
+    years = get_findex_metadata(df).years
+    year = years[-1] if years else 2024
+    pca_indicators = [ind for group in INDICATOR_GROUPS.values() for ind in group.values()][:6]
+    pca_presets = {'カスタム選択': CENTRAL_AMERICA[:5], **REGION_GROUPS}
+    
+    tasks = [
+        ("キューブ", lambda: get_findex_cube(df)),
+        ("格差テーブル", lambda: get_gap_tables(df)),
+        ("国別プロファイル", lambda: get_country_profiles(df)),
+        ("類似国インデックス", lambda: build_similarity_index(df, year)),
+    ]
+    for name, countries in pca_presets.items():
+        tasks.append((f"PCA: {name}", lambda countries=countries: fit_pca_by_year(df, countries, pca_indicators)))
+    for wb_name in WB_INDICATORS:
+        tasks.append((f"機械学習: {wb_name}", lambda wb_name=wb_name: _warm_ml_default(df, wb_name, prefetch)))
+    return tasks
+
+@st.cache_resource(show_spinner=False)
+def _cache_warmup_state(dataset_version, _df, _prefetch):
+    tasks = warmup_tasks(_df, _prefetch)
+    state = {'total': len(tasks), 'done': 0, 'current': None, 'errors': [], 'finished': False,
+             'started': time.time(), 'elapsed': None}
+    
+    def run():
+        for label, task in tasks:
+            state['current'] = label
+            try:
+                with perf_stage('warmup'):
+                    task()
+            except Exception as e:
+                state['errors'].append(f"{label}: {e}")
+            state['done'] += 1
+        state['current'] = None
+        state['elapsed'] = time.time() - state['started']
+        state['finished'] = True
+    
+    threading.Thread(target=run, daemon=True).start()
+    return state
+
+def start_cache_warmup(df, prefetch):
+    """データセットのバージョンごとに一度だけ、既定表示の計算をバックグラウンドで始める（バージョンがなければNone）"""
+    version = df.attrs.get('dataset_version')
+    if version is None:
+        return None
+    return _cache_warmup_state(version, df, prefetch)
+
+def _render_warmup_status(state):
+    if state['finished']:
+        st.caption(f"✓ キャッシュ準備完了（{state['elapsed']:.1f}秒）")
+        for error in state['errors']:
+            st.caption(f"⚠️ {error}")
+    else:
+        st.progress(state['done'] / state['total'],
+                    text=f"キャッシュを準備中（{state['done']}/{state['total']}）: {state['current'] or ''}")
+
+@st.fragment(run_every=2)
+def _warmup_progress(state):
+    if state['finished']:
+        # 定期実行を止めるため、アプリ全体を再実行して静的な表示に切り替える
+        st.rerun()
+    _render_warmup_status(state)
+
+def warmup_status(state):
+    """ウォームアップの進み具合をサイドバーに表示する（完了までは2秒ごとに更新）"""
+    with st.sidebar:
+        if state['finished']:
+            _render_warmup_status(state)
         else:
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            gb_model = GradientBoostingRegressor(n_estimators=100, random_state=42)
-            gb_model.fit(X_train, y_train)
-            train_score = gb_model.score(X_train, y_train)
-            test_score = gb_model.score(X_test, y_test)
-            gb_pred_test = gb_model.predict(X_test)
-            gb_r2 = r2_score(y_test, gb_pred_test)
-            gb_mse = mean_squared_error(y_test, gb_pred_test)
-            
-            st.subheader("📈 モデル性能")
-            cols = st.columns(4)
-            with cols[0]:
-                st.metric("Train Score", f"{train_score:.3f}")
-            with cols[1]:
-                st.metric("Test Score", f"{test_score:.3f}")
-            with cols[2]:
-                st.metric("Test R²", f"{gb_r2:.3f}")
-            with cols[3]:
-                st.metric("Test MSE", f"{gb_mse:.2f}")
-            
-            st.subheader("📊 特徴量重要度")
-            importance_df = pd.DataFrame({
-                '指標': feature_variables,
-                '重要度': gb_model.feature_importances_
-            }).sort_values('重要度', ascending=False)
-            fig_imp = px.bar(importance_df, x='重要度', y='指標', orientation='h',
-                            title="特徴量重要度ランキング（勾配ブースティング）")
-            st.plotly_chart(fig_imp, use_container_width=True)
+            _warmup_progress(state)
+
+def collect_perf_snapshot():
+    """計測値に分析結果キャッシュのヒット・ミス数を加えたスナップショット"""
+    snapshot = get_perf_recorder().snapshot()
+    ml_cache = get_ml_result_cache()
+    snapshot['caches']['ml_result'] = {'hit': ml_cache.hits, 'miss': ml_cache.misses}
+    return snapshot
+
+def performance_panel():
+    """?debug=1（または環境変数FINDEX_DEBUG=1）のときだけ表示する計測パネル"""
+    snapshot = collect_perf_snapshot()
+    with st.sidebar.expander("⏱️ パフォーマンス計測", expanded=True):
+        st.caption("rerunは前回までの再実行全体の所要時間（ミリ秒）")
+        stages = pd.DataFrame.from_dict(snapshot['stages'], orient='index')
+        if not stages.empty:
+            stages[['total', 'last', 'p50', 'p95', 'p99']] *= 1000
+            st.dataframe(stages.round(1).rename_axis('段階'), use_container_width=True)
+        caches = pd.DataFrame.from_dict(snapshot['caches'], orient='index').fillna(0).astype(int)
+        if not caches.empty:
+            st.dataframe(caches.rename_axis('キャッシュ'), use_container_width=True)
+        st.download_button("JSONで保存", json.dumps(snapshot, ensure_ascii=False, indent=2),
+                           file_name='findex_perf.json', mime='application/json')
+        st.download_button("Prometheus形式で保存", perf_to_prometheus(snapshot),
+                           file_name='findex_perf.prom', mime='text/plain')
 
 def main():
     st.title("📊 Global Findex 2025 データ分析アプリケーション")
     st.markdown("### 中米グアテマラを中心とした金融包摂データの多角的分析")
     st.markdown("---")
     
-    df = load_findex_data()
+    with perf_stage('load'):
+        df = load_findex_data()
     
-    if df.empty:
+    if findex_row_count(df) == 0:
         st.error("データを読み込めませんでした")
         return
     
+    get_findex_metadata(df)
+    prefetch = start_world_bank_prefetch()
+    warmup = start_cache_warmup(df, prefetch) if WARMUP_ENABLED else None
+    
     st.sidebar.title("🔍 分析機能選択")
     analysis_type = st.sidebar.selectbox("分析機能を選択してください",
-        ["指標別グラフ可視化", "国別プロファイル", "PCA（主成分分析）", "機械学習分析"])
+        ["指標別グラフ可視化", "国別プロファイル", "格差ランキング", "指標間の相関", "PCA（主成分分析）",
+         "機械学習分析"])
+    
+    if warmup is not None:
+        warmup_status(warmup)
+    
+    with st.sidebar.expander("💾 メモリ使用量"):
+        st.dataframe(findex_memory_report(df), hide_index=True)
+    
+    with perf_stage(f"page:{analysis_type}"):
+        if analysis_type == "指標別グラフ可視化":
+            indicator_analysis(df)
+        elif analysis_type == "国別プロファイル":
+            country_profile(df)
+        elif analysis_type == "格差ランキング":
+            gap_ranking(df)
+        elif analysis_type == "指標間の相関":
+            correlation_explorer(df)
+        elif analysis_type == "PCA（主成分分析）":
+            correspondence_analysis(df)
+        elif analysis_type == "機械学習分析":
+            machine_learning_analysis(df)
     
-    if analysis_type == "指標別グラフ可視化":
-        indicator_analysis(df)
-    elif analysis_type == "国別プロファイル":
-        country_profile(df)
-    elif analysis_type == "PCA（主成分分析）":
-        correspondence_analysis(df)
-    elif analysis_type == "機械学習分析":
-        machine_learning_analysis(df)
+    if PERF_DEBUG or st.query_params.get('debug') == '1':
+        performance_panel()
 
 if __name__ == "__main__":
-    main()
+    with perf_stage('rerun'):
+        main()
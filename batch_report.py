@@ -0,0 +1,206 @@
+"""Global Findexのブリーフィング資料（HTML/PNG/CSV）をブラウザなしで一括生成するCLI
+
+app.py の分析関数をそのまま使い、地域グループ（REGION_GROUPS）ごとに指標別グラフ・
+国別プロファイル・PCAを、--ml を付けると機械学習分析の結果も出力する。
+各グループはプロセスプールで並列に処理し、最後に一覧ページ index.html を書き出す。
+app.py と同じくリポジトリ直下（Findexのブックがある場所）で実行すること。
+
+使い方: python batch_report.py --out reports/2025-10 [--groups 中米9カ国 南米8カ国]
+        [--years 2021 2024] [--formats html csv png] [--ml] [--workers 4]
+"""
+import argparse
+import html
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import streamlit.logger
+
+# Streamlitのランタイム外で app を読み込むため、キャッシュの警告ログを先に抑えておく
+streamlit.logger.set_log_level('error')
+
+import app  # noqa: E402
+
+CATEGORIES = ["全体", "男女別", "所得水準別"]
+FORMATS = ['html', 'csv', 'png']
+PCA_DEFAULT_INDICATORS = 6
+ML_DEFAULT_TARGET = "経済成長率"
+
+_df = None
+
+
+def _init_worker():
+    global _df
+    _df = app.load_findex_data()
+
+
+def _slug(text):
+    return re.sub(r'[^\w\-]+', '_', text).strip('_')[:80]
+
+
+class ReportWriter:
+    """1ジョブ分の出力先ディレクトリと、書き出したファイルの一覧を管理する"""
+
+    def __init__(self, out_dir, subdir, formats):
+        self.out_dir = out_dir
+        self.subdir = subdir
+        self.formats = formats
+        self.entries = []
+        os.makedirs(os.path.join(out_dir, subdir), exist_ok=True)
+
+    def _path(self, name, ext):
+        return os.path.join(self.subdir, f"{_slug(name)}.{ext}")
+
+    def figure(self, section, name, fig):
+        if 'html' in self.formats:
+            path = self._path(name, 'html')
+            # plotly.min.js はディレクトリに1つだけ置き、オフラインでも開けるようにする
+            fig.write_html(os.path.join(self.out_dir, path), include_plotlyjs='directory')
+            self.entries.append((section, name, path))
+        if 'png' in self.formats:
+            path = self._path(name, 'png')
+            fig.write_image(os.path.join(self.out_dir, path), scale=2)
+            self.entries.append((section, name, path))
+
+    def table(self, section, name, table, index=False):
+        if 'csv' in self.formats:
+            path = self._path(name, 'csv')
+            table.to_csv(os.path.join(self.out_dir, path), index=index, encoding='utf-8-sig')
+            self.entries.append((section, name, path))
+
+
+def build_region_report(group, out_dir, years, categories, formats):
+    """地域グループ1つ分の指標別グラフ・国別プロファイル・PCAを書き出す"""
+    countries = app.REGION_GROUPS[group]
+    writer = ReportWriter(out_dir, _slug(group), formats)
+    indicators = {jp: eng for group_indicators in app.INDICATOR_GROUPS.values()
+                  for jp, eng in group_indicators.items()}
+
+    for jp, eng in indicators.items():
+        for category in categories:
+            for year in years:
+                fig, data = app.indicator_bar_figure(_df, eng, jp, countries, category, year)
+                if fig is None:
+                    continue
+                writer.figure("指標別グラフ", f"{jp}_{category}_{year}", fig)
+                writer.table("指標別グラフ", f"{jp}_{category}_{year}", data)
+            fig = app.indicator_line_figure(_df, eng, jp, countries, category)
+            writer.figure("指標別グラフ（時系列）", f"{jp}_{category}_時系列", fig)
+
+    for year in years:
+        profiles = {country: app.country_profile_values(_df, country, year) for country in countries}
+        profile_table = pd.DataFrame.from_dict(profiles, orient='index')
+        if profile_table.empty:
+            continue
+        writer.table("国別プロファイル", f"プロファイル_{year}", profile_table.rename_axis('国'), index=True)
+        for country, values in profiles.items():
+            if values:
+                writer.figure("国別プロファイル", f"プロファイル_{country}_{year}",
+                              app.country_radar_figure(values, country))
+
+    pca_labels = list(indicators)[:PCA_DEFAULT_INDICATORS]
+    results = app.fit_pca_by_year(_df, countries, [indicators[jp] for jp in pca_labels])
+    for year in years:
+        if year not in results:
+            continue
+        result = results[year]
+        writer.figure("PCA", f"PCA_{year}", app.pca_biplot_figure(result, pca_labels, year))
+        loadings = pd.DataFrame(result['loadings'], columns=['第1主成分', '第2主成分'])
+        loadings.insert(0, '指標', pca_labels)
+        writer.table("PCA", f"PCA負荷量_{year}", loadings)
+        scores = pd.DataFrame(result['scores'], columns=['第1主成分', '第2主成分'])
+        scores.insert(0, '国', result['countries'])
+        writer.table("PCA", f"PCA得点_{year}", scores)
+    return group, writer.entries
+
+
+def build_ml_report(region_scope, out_dir, target, formats):
+    """機械学習分析（全モデル）の結果を書き出す（世界銀行データが取得できなければ空）"""
+    writer = ReportWriter(out_dir, os.path.join('ml', _slug(region_scope)), formats)
+    features = [f for f in app.ML_DEFAULT_FEATURES if f in app.get_all_indicators(_df)]
+    for model_type in app.ML_MODEL_TYPES + ["全モデル比較（交差検証）"]:
+        result = app.run_ml_analysis(_df, 'wb', target, features, region_scope, model_type)
+        if result['status'] != 'ok':
+            break
+        name = f"{target}_{model_type}"
+        writer.figure(model_type, name, app.ml_result_figure(result))
+        if 'cv_summary' in result:
+            writer.table(model_type, name, app.ml_cv_summary_table(result['cv_summary']))
+            continue
+        writer.table(model_type, f"{name}_評価指標",
+                     pd.DataFrame(result['metrics'], columns=['指標', '値']))
+        writer.table(model_type, f"{name}_係数・重要度", result.get('coef_df', result.get('importance_df')))
+    return f"機械学習: {region_scope}", writer.entries
+
+
+def write_index(out_dir, reports):
+    lines = ['<!DOCTYPE html>', '<html lang="ja"><head><meta charset="utf-8">',
+             '<title>Global Findex ブリーフィング資料</title></head><body>',
+             f'<h1>Global Findex ブリーフィング資料</h1><p>作成: {time.strftime("%Y-%m-%d %H:%M")}</p>']
+    for title, entries in reports:
+        lines.append(f'<h2>{html.escape(title)}</h2>')
+        sections = {}
+        for section, name, path in entries:
+            sections.setdefault(section, []).append((name, path))
+        for section, items in sections.items():
+            lines.append(f'<h3>{html.escape(section)}</h3><ul>')
+            lines.extend(f'<li><a href="{html.escape(path)}">{html.escape(name)}</a> '
+                         f'({os.path.splitext(path)[1][1:]})</li>' for name, path in items)
+            lines.append('</ul>')
+    lines.append('</body></html>')
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', required=True, help="出力先ディレクトリ")
+    parser.add_argument('--groups', nargs='+', choices=list(app.REGION_GROUPS), default=list(app.REGION_GROUPS))
+    parser.add_argument('--years', nargs='+', type=int, help="対象年（省略時は最新年）")
+    parser.add_argument('--categories', nargs='+', choices=CATEGORIES, default=CATEGORIES)
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['html', 'csv'])
+    parser.add_argument('--ml', action='store_true', help="機械学習分析（世界銀行データを使用）も出力する")
+    parser.add_argument('--ml-target', choices=list(app.WB_INDICATORS), default=ML_DEFAULT_TARGET)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    if 'png' in args.formats:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error("PNG出力には kaleido が必要です（pip install kaleido）")
+
+    df = app.load_findex_data()
+    if app.findex_row_count(df) == 0:
+        print("データを読み込めませんでした", file=sys.stderr)
+        return 1
+    years = args.years or app.get_findex_metadata(df).years[-1:]
+    # 子プロセスが共有できるよう、キャッシュとPCA用のキューブをここで作っておく
+    app.get_findex_cube(df)
+
+    start = time.perf_counter()
+    os.makedirs(args.out, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(build_region_report, group, args.out, years, args.categories, args.formats)
+                   for group in args.groups]
+        if args.ml:
+            futures += [pool.submit(build_ml_report, scope, args.out, args.ml_target, args.formats)
+                        for scope in app.ML_COUNTRY_GROUPS]
+        reports = {}
+        for future in as_completed(futures):
+            title, entries = future.result()
+            reports[title] = entries
+            print(f"{title}: {len(entries)}ファイル")
+
+    order = list(args.groups) + [f"機械学習: {scope}" for scope in app.ML_COUNTRY_GROUPS]
+    write_index(args.out, [(title, reports[title]) for title in order if title in reports])
+    print(f"{sum(len(e) for e in reports.values())}ファイルを {time.perf_counter() - start:.1f}秒で "
+          f"{os.path.join(args.out, 'index.html')} に書き出しました")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
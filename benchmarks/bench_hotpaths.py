@@ -0,0 +1,172 @@
+"""主要な処理（読み込み・抽出・時系列・PCA・機械学習）の所要時間を計測するベンチマーク
+
+一時ディレクトリに合成ブック（make_synthetic_workbook.py）を作り、そこで app を読み込んで計測する。
+各項目はまず計測しない実行を --warmup 回行い（遅延importや初回呼び出しの費用を除くため）、
+計測した中央値を baselines.json と比べ、許容倍率を超えて遅くなった項目があれば終了コード1で終わる。
+ベースラインは計測したマシンに依存するため、基準にするマシンで --update-baseline を付けて更新すること。
+
+使い方: python benchmarks/bench_hotpaths.py [--runs 5] [--warmup 1] [--tolerance 1.5] [--only load pca]
+        [--update-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baselines.json')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+# 計測値がこれ未満の差ならタイマーの揺らぎとみなして回帰にしない
+MIN_REGRESSION_SECONDS = 0.005
+ML_TARGET = 'Account (%, age 15+)'
+ML_REGION_SCOPE = '中所得国110カ国'
+
+
+def build_benchmarks(app, df):
+    """{名前: (準備処理, 計測する処理)} を返す。準備処理はst.cache_dataを消して毎回同じ条件にする"""
+    import streamlit as st
+
+    metadata = app.get_findex_metadata(df)
+    indicators = [ind for group in app.INDICATOR_GROUPS.values() for ind in group.values()
+                  if ind in metadata.indicators]
+    countries = [c for group in app.REGION_GROUPS.values() for c in group]
+    features = [f for f in app.ML_DEFAULT_FEATURES if f in metadata.indicators]
+
+    def clear_derived():
+        st.cache_data.clear()
+
+    def load_cold():
+        app._cached_findex_data.clear()
+        for name in (app.FINDEX_CACHE_FILE, app.FINDEX_MANIFEST_FILE):
+            path = os.path.join(app.FINDEX_CACHE_DIR, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def filter_loop():
+        for indicator in indicators:
+            for group in ('all', 'gender', 'income'):
+                app.get_data_for_indicator(df, indicator, group, metadata.years[-1])
+
+    def time_series_loop():
+        for indicator in indicators:
+            app.get_time_series_data(df, indicator, countries)
+            for group, sub_groups in (('gender', {'men': '男性', 'women': '女性'}),
+                                      ('income', {'richest 60%': '富裕層60%', 'poorest 40%': '貧困層40%'})):
+                app.get_time_series_data(df, indicator, countries, group, sub_groups)
+
+    benchmarks = {
+        'load_cold': (load_cold, app.load_findex_data),
+        'load_warm': (app._cached_findex_data.clear, app.load_findex_data),
+        'get_data_for_indicator': (clear_derived, filter_loop),
+        'time_series': (clear_derived, time_series_loop),
+        'pca_matrix': (clear_derived, lambda: app.build_feature_tensor(df, countries, indicators, metadata.years)),
+        'pca_all_years': (clear_derived, lambda: app.fit_pca_by_year(df, countries, indicators[:6])),
+    }
+    for model_type in app.ML_MODEL_TYPES + ["全モデル比較（交差検証）"]:
+        benchmarks[f"ml:{model_type}"] = (
+            clear_derived,
+            lambda model_type=model_type: app.run_ml_analysis(df, 'findex', ML_TARGET, features,
+                                                              ML_REGION_SCOPE, model_type))
+    return benchmarks
+
+
+def run_benchmarks(runs, only=None, warmup=1):
+    import make_synthetic_workbook
+
+    os.environ.setdefault('FINDEX_WB_BACKEND', 'local')
+    import app
+
+    timings = {}
+    with tempfile.TemporaryDirectory(prefix='findex_bench_') as workdir:
+        os.chdir(workdir)
+        try:
+            make_synthetic_workbook.make_synthetic_frame().to_excel(app.FINDEX_WORKBOOK, sheet_name='Data',
+                                                                    index=False)
+            df = app.load_findex_data()
+            for name, (setup, func) in build_benchmarks(app, df).items():
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                for _ in range(warmup):
+                    setup()
+                    func()
+                samples = []
+                for _ in range(runs):
+                    setup()
+                    start = time.perf_counter()
+                    func()
+                    samples.append(time.perf_counter() - start)
+                timings[name] = samples
+                print(f"{name:<32} 中央値 {statistics.median(samples) * 1000:9.1f}ms  "
+                      f"最小 {min(samples) * 1000:9.1f}ms")
+        finally:
+            os.chdir(APP_DIR)
+    return timings
+
+
+def read_baselines():
+    try:
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_baselines(timings):
+    baselines = read_baselines()
+    baselines.setdefault('seconds', {}).update({name: statistics.median(s) for name, s in timings.items()})
+    baselines['machine'] = {'python': platform.python_version(), 'platform': platform.platform(),
+                            'cpus': os.cpu_count(), 'updated': time.strftime('%Y-%m-%d')}
+    with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(timings, baselines, tolerance):
+    failed = []
+    for name, samples in timings.items():
+        baseline = baselines.get('seconds', {}).get(name)
+        if baseline is None:
+            print(f"{name}: ベースラインなし")
+            continue
+        median = statistics.median(samples)
+        if median > baseline * tolerance and median - baseline > MIN_REGRESSION_SECONDS:
+            failed.append(name)
+            print(f"NG: {name} が {median / baseline:.2f}倍に遅くなっています"
+                  f"（{baseline * 1000:.1f}ms → {median * 1000:.1f}ms）")
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1, help="計測前に捨てる実行の回数")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="ベースラインに対して許容する倍率")
+    parser.add_argument('--only', nargs='+', help="名前がこれで始まる項目だけを計測する")
+    parser.add_argument('--update-baseline', action='store_true', help="計測結果でbaselines.jsonを更新する")
+    args = parser.parse_args(argv)
+
+    timings = run_benchmarks(args.runs, args.only, args.warmup)
+    if args.update_baseline:
+        write_baselines(timings)
+        print(f"{BASELINE_FILE} を更新しました")
+        return 0
+
+    baselines = read_baselines()
+    machine = baselines.get('machine')
+    if machine:
+        print(f"ベースライン: {machine['updated']} / Python {machine['python']} / {machine['cpus']}CPU")
+    failed = compare(timings, baselines, args.tolerance)
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
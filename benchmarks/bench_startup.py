@@ -0,0 +1,65 @@
+"""app.py の起動（import）時間を計測するベンチマーク
+
+重い分析ライブラリが起動時に読み込まれていないこと、import時間の中央値が
+予算内に収まっていることを確認し、どちらかに違反すれば終了コード1で終わる。
+
+使い方: python benchmarks/bench_startup.py [--runs 5] [--budget 2.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 1コアのマシン（streamlit 1.65・pandas 3.0）で中央値約1.6秒（7回で1.5〜1.9秒）。
+# ばらつきや遅めのマシンでも誤検知しない程度の余裕を持たせた値
+IMPORT_BUDGET_SECONDS = 2.5
+
+DEFERRED_MODULES = ['sklearn', 'statsmodels', 'scipy', 'plotly.subplots']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure_import(python=sys.executable):
+    env = dict(os.environ, FINDEX_WB_BACKEND='local')
+    completed = subprocess.run([python, '-c', PROBE % DEFERRED_MODULES], cwd=APP_DIR, env=env,
+                               capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET_SECONDS)
+    args = parser.parse_args(argv)
+
+    results = [measure_import() for _ in range(args.runs)]
+    timings = [r['seconds'] for r in results]
+    median = statistics.median(timings)
+    loaded = sorted({m for r in results for m in r['loaded']})
+
+    print(f"import app: 中央値 {median:.3f}s / 最小 {min(timings):.3f}s / 最大 {max(timings):.3f}s "
+          f"(予算 {args.budget:.2f}s, {args.runs}回)")
+    failed = False
+    if loaded:
+        print(f"NG: 起動時に読み込まれてはいけないモジュール: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget:
+        print(f"NG: import時間が予算を {median - args.budget:.3f}s 超過しています")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""世界銀行APIのページング取得（_fetch_wb_api）をローカルの模擬サーバーで確認する
+
+1ページの件数を小さく抑えたAPI互換のサーバーを立て、全対象国を複数ページに分けて返す。
+すべてのページが1回ずつ要求され、レコードが欠けも重複もなく結合されることと、
+データのない指標（2要素目がnull）で空のリストが返ることを確かめ、問題があれば終了コード1で終わる。
+
+使い方: python benchmarks/check_wb_paging.py [--per-page 40]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import streamlit.logger  # noqa: E402
+
+streamlit.logger.set_log_level('error')
+
+import app  # noqa: E402
+
+EMPTY_INDICATOR = 'EMPTY.INDICATOR'
+
+
+def make_handler(per_page, requests_seen):
+    class PagedHandler(BaseHTTPRequestHandler):
+        """/country/<コード;...>/indicator/<指標>?date=&page= に、APIと同じ [メタ情報, レコード] で応答する"""
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            parts = url.path.split('/')
+            codes = parts[parts.index('country') + 1].split(';')
+            indicator = parts[parts.index('indicator') + 1]
+            page = int(query.get('page', ['1'])[0])
+            requests_seen.append((indicator, page))
+
+            if indicator == EMPTY_INDICATOR:
+                body = [{'page': 1, 'pages': 0, 'per_page': per_page, 'total': 0}, None]
+            else:
+                records = [{'indicator': {'id': indicator, 'value': indicator}, 'country': {'id': code, 'value': code},
+                            'date': query['date'][0], 'value': float(i)} for i, code in enumerate(codes)]
+                pages = max(1, -(-len(records) // per_page))
+                body = [{'page': page, 'pages': pages, 'per_page': per_page, 'total': len(records)},
+                        records[(page - 1) * per_page:page * per_page]]
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return PagedHandler
+
+
+def run_checks(per_page):
+    requests_seen = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(per_page, requests_seen))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app.WB_API_URL = f"http://127.0.0.1:{server.server_address[1]}"
+
+    failures = []
+    codes = app._wb_country_codes()
+    indicator = next(iter(app.WB_INDICATORS.values()))
+    expected_pages = -(-len(codes) // per_page)
+    try:
+        records = app._fetch_wb_api(indicator, 2024, codes)
+        pages = [page for ind, page in requests_seen if ind == indicator]
+        fetched = [r['country']['id'] for r in records]
+        if pages != list(range(1, expected_pages + 1)):
+            failures.append(f"要求したページが {pages}（期待値 1〜{expected_pages}）")
+        if sorted(fetched) != sorted(codes):
+            failures.append(f"レコード {len(fetched)}件（期待値 {len(codes)}件、重複・欠落あり）")
+        print(f"{indicator}: {len(pages)}ページ / {len(records)}件")
+
+        empty = app._fetch_wb_api(EMPTY_INDICATOR, 2024, codes)
+        if empty != []:
+            failures.append(f"データなしの指標で {len(empty)}件が返りました")
+
+        # ディスクキャッシュ経由でも全ページが結合されて保存されること
+        with tempfile.TemporaryDirectory(prefix='findex_wb_') as workdir:
+            cache_dir = app.WB_CACHE_DIR
+            app.WB_CACHE_DIR = os.path.join(workdir, 'worldbank')
+            try:
+                requests_seen.clear()
+                cached = app.fetch_world_bank_records(indicator, 2024, backend='api')
+                stored = app._wb_store_read(indicator, 2024, codes)
+                if len(cached) != len(codes) or stored is None or len(stored[0]) != len(codes):
+                    failures.append("fetch_world_bank_records の結果またはキャッシュの件数が一致しません")
+            finally:
+                app.WB_CACHE_DIR = cache_dir
+    finally:
+        server.shutdown()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--per-page', type=int, default=40, help="模擬サーバーが1ページに返す件数の上限")
+    args = parser.parse_args(argv)
+
+    failures = run_checks(args.per_page)
+    for failure in failures:
+        print(f"NG: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
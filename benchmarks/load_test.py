@@ -0,0 +1,208 @@
+"""複数ユーザーの同時利用を模擬する負荷テスト
+
+StreamlitのAppTestでN個のセッションを同時に動かし、各セッションが台本どおりに
+ウィジェットを操作してページを巡回する。AppTestはランタイムをプロセス全体で持つため、
+セッションは1つずつ別プロセスで動かす（ディスク上のキャッシュ・キューブ・分析結果は
+複数ワーカー構成のサーバーと同じく共有される）。
+世界銀行データはローカルのフィクスチャ（FINDEX_WB_BACKEND=local）から読む。
+再実行1回ごとの所要時間から、スループットとp50/p95/p99レイテンシ、セッションごとのピークRSSを報告する。
+
+使い方: python benchmarks/load_test.py [--sessions 8] [--iterations 2] [--scenario all|ml]
+        [--ramp-up 2.0] [--synthetic] [--cold] [--json results.json]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+APP_FILE = os.path.join(APP_DIR, 'app.py')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+RUN_TIMEOUT_SECONDS = 300
+
+
+def _select(at, label, value):
+    next(w for w in at.selectbox if w.label == label).set_value(value)
+
+
+def _click(at, label):
+    next(w for w in at.button if w.label == label).click()
+
+
+def _page(name):
+    return lambda at, rng: at.sidebar.selectbox[0].set_value(name)
+
+
+def _run_ml(model_type=None):
+    def step(at, rng):
+        import app
+        _select(at, "分析対象地域", rng.choice(list(app.ML_COUNTRY_GROUPS)))
+        _select(at, "使用するモデル", model_type or rng.choice(app.ML_MODEL_TYPES))
+        _click(at, "🚀 分析実行")
+    return step
+
+
+def _pick_country(at, rng):
+    widget = next(w for w in at.selectbox if w.label == "分析対象国を選択")
+    widget.set_value(rng.choice(widget.options))
+
+
+def _pick_region_group(at, rng):
+    import app
+    _select(at, "地域グループから選択", rng.choice(list(app.REGION_GROUPS)))
+
+
+# (ラベル, 操作) の並び。ラベルごとにレイテンシを集計する
+SCENARIOS = {
+    'all': [
+        ("指標別: 表示", _page("指標別グラフ可視化")),
+        ("指標別: 時系列", lambda at, rng: _select(at, "グラフタイプを選択", "折れ線グラフ（時系列）")),
+        ("指標別: 男女別", lambda at, rng: _select(at, "分析カテゴリを選択", "男女別")),
+        ("国別: 表示", _page("国別プロファイル")),
+        ("国別: 国を変更", _pick_country),
+        ("PCA: 表示", _page("PCA（主成分分析）")),
+        ("PCA: 地域を変更", _pick_region_group),
+        ("ML: 表示", _page("機械学習分析")),
+        ("ML: 分析実行", _run_ml()),
+    ],
+    'ml': [
+        ("ML: 表示", _page("機械学習分析")),
+        ("ML: 分析実行", _run_ml()),
+        ("ML: 全モデル比較", _run_ml("全モデル比較（交差検証）")),
+    ],
+}
+
+
+def run_session(session_id, scenario, iterations, start_delay):
+    """1セッション分の台本を実行し、(再実行ごとの所要時間, エラー, ピークRSS[MB]) を返す"""
+    from streamlit.testing.v1 import AppTest
+
+    time.sleep(start_delay)
+    rng = random.Random(session_id)
+    at = AppTest.from_file(APP_FILE, default_timeout=RUN_TIMEOUT_SECONDS)
+    samples, errors = [], []
+
+    def timed_run(label):
+        start = time.perf_counter()
+        at.run()
+        samples.append((label, time.perf_counter() - start))
+        if at.exception:
+            errors.append((session_id, label, at.exception[0].message))
+
+    timed_run("初回表示")
+    for _ in range(iterations):
+        for label, step in SCENARIOS[scenario]:
+            try:
+                step(at, rng)
+            except (StopIteration, IndexError):
+                errors.append((session_id, label, "操作するウィジェットが見つかりません"))
+                return samples, errors, _peak_rss_mb()
+            timed_run(label)
+    return samples, errors, _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    # Linuxではキロバイト単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(samples, wall_seconds, peak_rss):
+    latencies = np.array([seconds for _, seconds in samples])
+    by_label = {}
+    for label, seconds in samples:
+        by_label.setdefault(label, []).append(seconds)
+
+    def stats(values):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {'count': len(values), 'p50': p50, 'p95': p95, 'p99': p99, 'max': float(np.max(values))}
+
+    return {
+        'reruns': len(samples),
+        'wall_seconds': wall_seconds,
+        'throughput_per_second': len(samples) / wall_seconds,
+        'latency': stats(latencies),
+        'latency_by_step': {label: stats(values) for label, values in by_label.items()},
+        'peak_rss_mb': {'max': max(peak_rss), 'sum': sum(peak_rss)},
+    }
+
+
+def prepare_synthetic_workdir():
+    """合成ブックと世界銀行の合成フィクスチャを置いた一時ディレクトリを作る"""
+    import make_synthetic_workbook
+    import app
+
+    workdir = tempfile.mkdtemp(prefix='findex_load_')
+    make_synthetic_workbook.make_synthetic_frame().to_excel(
+        os.path.join(workdir, app.FINDEX_WORKBOOK), sheet_name='Data', index=False)
+    make_synthetic_workbook.write_synthetic_wb_fixtures(os.path.join(workdir, app.WB_FIXTURE_DIR))
+    return workdir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=2, help="各セッションが台本を繰り返す回数")
+    parser.add_argument('--scenario', choices=list(SCENARIOS), default='all')
+    parser.add_argument('--ramp-up', type=float, default=2.0, help="全セッションが開始するまでの秒数")
+    parser.add_argument('--synthetic', action='store_true', help="合成データを置いた一時ディレクトリで実行する")
+    parser.add_argument('--cold', action='store_true', help="Findexのディスクキャッシュを事前に作らずに始める")
+    parser.add_argument('--json', metavar='PATH', help="結果をJSONで保存する")
+    args = parser.parse_args(argv)
+
+    os.environ['FINDEX_WB_BACKEND'] = 'local'
+    workdir = prepare_synthetic_workdir() if args.synthetic else None
+    os.chdir(workdir or APP_DIR)
+
+    samples, errors, peak_rss = [], [], []
+    try:
+        if not args.cold:
+            import app
+            app.load_findex_frame()
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.sessions) as pool:
+            futures = [pool.submit(run_session, i, args.scenario, args.iterations,
+                                   args.ramp_up * i / max(1, args.sessions))
+                       for i in range(args.sessions)]
+            for future in futures:
+                session_samples, session_errors, session_rss = future.result()
+                samples.extend(session_samples)
+                errors.extend(session_errors)
+                peak_rss.append(session_rss)
+        wall_seconds = time.perf_counter() - start
+    finally:
+        os.chdir(APP_DIR)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    summary = summarize(samples, wall_seconds, peak_rss)
+    summary.update(sessions=args.sessions, iterations=args.iterations, scenario=args.scenario, errors=len(errors))
+
+    print(f"{args.sessions}セッション × {args.iterations}回（{args.scenario}）: 再実行{summary['reruns']}回 / "
+          f"{wall_seconds:.1f}秒 / {summary['throughput_per_second']:.2f}回/秒 / エラー{len(errors)}件")
+    print(f"ピークRSS: セッション最大 {summary['peak_rss_mb']['max']:.0f}MB / "
+          f"合計 {summary['peak_rss_mb']['sum']:.0f}MB")
+    print(f"{'段階':<20}{'回数':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}  (ミリ秒)")
+    for label, stats in [('全体', summary['latency'])] + list(summary['latency_by_step'].items()):
+        print(f"{label:<20}{stats['count']:>6}" + ''.join(f"{stats[k] * 1000:>10.0f}"
+                                                          for k in ('p50', 'p95', 'p99', 'max')))
+    for session_id, label, message in errors[:5]:
+        print(f"エラー（セッション{session_id}・{label}）: {message}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Findexブックと同じスキーマの合成データ（Dataシート）を生成する
+
+実データはリポジトリに含まれないため、ベンチマークや動作確認にはこのブックを使う。
+国ごとの潜在的な「金融包摂度」と指標ごとの難易度から値を作るので、
+指標間に相関があり、PCAや回帰でも意味のある構造が出る。
+
+使い方: python benchmarks/make_synthetic_workbook.py [--out Findex2025_1760415783997.xlsx]
+        [--indicators 80] [--extra-economies 0] [--years 2011 2014 2017 2021 2022 2024]
+        [--missing 0.1] [--seed 0] [--wb-fixtures wb_fixtures]
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import streamlit.logger  # noqa: E402
+
+streamlit.logger.set_log_level('error')
+
+import app  # noqa: E402
+
+DEFAULT_YEARS = [2011, 2014, 2017, 2021, 2022, 2024]
+SLICES = [('all', 'all'), ('gender', 'men'), ('gender', 'women'),
+          ('income', 'richest 60%'), ('income', 'poorest 40%'),
+          ('age', 'young adults'), ('age', 'older adults'),
+          ('education', 'primary education or less'), ('education', 'secondary education or more')]
+# 属性区分ごとの水準のずれ（ロジット尺度）
+SLICE_SHIFTS = {'all': 0.0, 'men': 0.15, 'women': -0.15, 'richest 60%': 0.35, 'poorest 40%': -0.45,
+                'young adults': -0.1, 'older adults': 0.05, 'primary education or less': -0.4,
+                'secondary education or more': 0.3}
+
+
+def synthetic_indicators(n_indicators):
+    """アプリが参照する指標を先頭に置き、不足分を連番の指標で埋める"""
+    known = []
+    for group_indicators in app.INDICATOR_GROUPS.values():
+        known.extend(ind for ind in group_indicators.values() if ind not in known)
+    known.extend(ind for ind in app.ML_DEFAULT_FEATURES + list(app.COUNTRY_PROFILE_INDICATORS.values())
+                 if ind not in known)
+    extra = [f"Synthetic indicator {i} (%, age 15+)" for i in range(max(0, n_indicators - len(known)))]
+    return known + extra
+
+
+def make_synthetic_frame(n_indicators=80, extra_economies=0, years=DEFAULT_YEARS, missing=0.1, seed=0):
+    """Findexと同じ列構成（Economy・Demographic group・Demographic sub-group・Year・指標列）のDataFrameを作る"""
+    rng = np.random.default_rng(seed)
+    economies = list(app.COUNTRY_MAP) + [f"Synthetic economy {i}" for i in range(extra_economies)]
+    indicators = synthetic_indicators(n_indicators)
+    years = sorted(years)
+
+    grid = pd.MultiIndex.from_product([economies, range(len(SLICES)), years],
+                                      names=['Economy', 'slice', 'Year']).to_frame(index=False)
+    slices = np.array(SLICES, dtype=object)[grid['slice'].to_numpy()]
+    frame = pd.DataFrame({
+        'Economy': grid['Economy'],
+        'Economy Code': grid['Economy'].map({e: f"S{i:03d}" for i, e in enumerate(economies)}),
+        'Region': 'Synthetic region',
+        'Demographic group': slices[:, 0],
+        'Demographic sub-group': slices[:, 1],
+        'Year': grid['Year'],
+    })
+
+    level = rng.normal(0, 1.2, len(economies))
+    trend = rng.normal(0.08, 0.03, len(economies))
+    difficulty = rng.normal(0, 1, len(indicators))
+    loading = rng.uniform(0.5, 1.5, len(indicators))
+    e = pd.factorize(frame['Economy'])[0]
+    t = (frame['Year'].to_numpy() - years[0])
+    shift = frame['Demographic sub-group'].map(SLICE_SHIFTS).to_numpy()
+    logit = ((level[e] + trend[e] * t + shift)[:, None] * loading - difficulty
+             + rng.normal(0, 0.3, (len(frame), len(indicators))))
+    values = 1 / (1 + np.exp(-logit))
+    values[rng.random(values.shape) < missing] = np.nan
+    return pd.concat([frame, pd.DataFrame(values, columns=indicators)], axis=1)
+
+
+def write_synthetic_wb_fixtures(fixture_dir=app.WB_FIXTURE_DIR, years=(2024,), seed=0):
+    """ローカルの世界銀行バックエンド（FINDEX_WB_BACKEND=local）用に、APIの応答と同じ形式のJSONを書き出す"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(fixture_dir, exist_ok=True)
+    for code in app.WB_INDICATORS.values():
+        center, spread = rng.uniform(1, 50), rng.uniform(1, 10)
+        for year in years:
+            records = [{'indicator': {'id': code, 'value': code}, 'country': {'id': iso2, 'value': name},
+                        'date': str(year), 'value': float(center + spread * rng.normal())}
+                       for name, iso2 in app.COUNTRY_CODE_MAP.items()]
+            meta = {'page': 1, 'pages': 1, 'per_page': len(records), 'total': len(records)}
+            with open(os.path.join(fixture_dir, f"{code}_{year}.json"), 'w', encoding='utf-8') as f:
+                json.dump([meta, records], f, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', default=app.FINDEX_WORKBOOK)
+    parser.add_argument('--indicators', type=int, default=80, help="(%%, age 15+) 列の数")
+    parser.add_argument('--extra-economies', type=int, default=0, help="COUNTRY_MAPにない国の数（読み込み時に除外される）")
+    parser.add_argument('--years', nargs='+', type=int, default=DEFAULT_YEARS)
+    parser.add_argument('--missing', type=float, default=0.1, help="欠損セルの割合")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--wb-fixtures', metavar='DIR', help="世界銀行データの合成フィクスチャも書き出す")
+    args = parser.parse_args(argv)
+
+    frame = make_synthetic_frame(args.indicators, args.extra_economies, args.years, args.missing, args.seed)
+    frame.to_excel(args.out, sheet_name='Data', index=False)
+    print(f"{args.out}: {len(frame)}行 × {frame.shape[1]}列")
+    if args.wb_fixtures:
+        write_synthetic_wb_fixtures(args.wb_fixtures, seed=args.seed)
+        print(f"{args.wb_fixtures}: 世界銀行データ {len(app.WB_INDICATORS)}指標")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())